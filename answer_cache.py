@@ -0,0 +1,75 @@
+'''
+Semantic answer cache for the PDF and CSV chat tabs in data_analysis.
+A question is embedded and compared (cosine) with earlier questions asked against the same
+data version; above the similarity threshold the earlier answer is returned without running the agent.
+'''
+
+import threading
+import time
+from typing import Hashable, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    '''Fixed-capacity cache of (question vector, data version) -> answer with TTL and LRU eviction.'''
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 24 * 3600, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors = None  # (max_entries, dim) float32, allocated on first store
+        self._versions = [None] * max_entries  # a list, so tuple versions are compared whole, not broadcast
+        self._answers = [None] * max_entries
+        self._created = np.zeros(max_entries)
+        self._last_used = np.zeros(max_entries)
+        self._used = np.zeros(max_entries, dtype=bool)
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _live(self, now: float) -> np.ndarray:
+        return self._used & (now - self._created < self.ttl)
+
+    def lookup(self, vector, version: Hashable) -> Optional[str]:
+        '''Returns the cached answer of the most similar earlier question, or None on a miss.'''
+        now = time.time()
+        with self._lock:
+            if self._vectors is not None:
+                same_version = np.fromiter((v == version for v in self._versions), dtype=bool, count=self.max_entries)
+                candidates = np.flatnonzero(self._live(now) & same_version)
+                if candidates.size:
+                    scores = self._vectors[candidates] @ self._normalize(vector)
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        slot = candidates[best]
+                        self._last_used[slot] = now
+                        self.hits += 1
+                        return self._answers[slot]
+            self.misses += 1
+            return None
+
+    def store(self, vector, version: Hashable, answer: str) -> None:
+        '''Caches answer, reusing an empty or expired slot before evicting the least recently used one.'''
+        now = time.time()
+        vector = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            free = np.flatnonzero(~self._live(now))
+            slot = free[0] if free.size else int(np.argmin(self._last_used))
+            self._vectors[slot] = vector
+            self._versions[slot] = version
+            self._answers[slot] = answer
+            self._created[slot] = self._last_used[slot] = now
+            self._used[slot] = True
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
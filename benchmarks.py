@@ -0,0 +1,157 @@
+'''
+Benchmark runner for the markov_chain and learn_parall workloads.
+Results are written as JSON together with machine info, so runs from different versions can be compared:
+
+    python benchmarks.py --output bench_new.json --compare bench_old.json
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import timeit
+from datetime import datetime, timezone
+
+import numpy as np
+import scipy.sparse as sp
+
+import learn_parall
+from markov_chain import MarkovChain
+
+
+def machine_info():
+    '''Returns the environment details needed to compare results across machines and versions.'''
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "git_commit": commit,
+    }
+
+
+def measure(name, func, params, repeat, items=None):
+    '''Times func() `repeat` times (after one warm-up call) and returns a result record.'''
+    func()
+    timings = timeit.repeat(func, number=1, repeat=repeat)
+    best = min(timings)
+    result = {
+        "name": name,
+        "params": params,
+        "repeat": repeat,
+        "min_s": best,
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.mean(timings),
+    }
+    if items:
+        result["items_per_s"] = items / best
+    print(f"{name:<32} {json.dumps(params):<50} min {best * 1e3:10.3f} ms")
+    return result
+
+
+def random_chain(state_count, nonzeros_per_row, seed=0):
+    '''A random chain; dense when every row is full, otherwise sparse CSR.'''
+    rng = np.random.default_rng(seed)
+    if nonzeros_per_row >= state_count:
+        matrix = rng.random((state_count, state_count))
+        return MarkovChain(matrix / matrix.sum(axis=1, keepdims=True), seed=seed)
+    rows = np.repeat(np.arange(state_count), nonzeros_per_row)
+    cols = rng.integers(0, state_count, rows.size)
+    matrix = sp.csr_matrix((rng.random(rows.size), (rows, cols)), shape=(state_count, state_count))
+    return MarkovChain(sp.diags(1.0 / np.asarray(matrix.sum(axis=1)).ravel()) @ matrix, seed=seed)
+
+
+def bench_markov_chain(repeat):
+    results = []
+    for state_count, nonzeros in [(2, 2), (100, 100), (100_000, 8)]:
+        chain = random_chain(state_count, nonzeros)
+        for n_chains, length in [(1, 10_000), (1_000, 1_000), (10_000, 100)]:
+            params = {"states": state_count, "nonzeros_per_row": nonzeros, "chains": n_chains, "length": length}
+            results.append(measure("markov_chain.sample", lambda: chain.sample(0, length, n_chains=n_chains),
+                                   params, repeat, items=n_chains * length))
+    chain = random_chain(2, 2)
+    results.append(measure("markov_chain.generate_sequence", lambda: chain.generate_sequence(0, 10_000),
+                           {"states": 2, "length": 10_000}, repeat, items=10_000))
+    return results
+
+
+def bench_parallel(repeat, n1, n2):
+    results = []
+    params = {"n1": n1, "n2": n2}
+    for name, func in [("learn_parall.threads", learn_parall.test_threadings),
+                       ("learn_parall.processes", learn_parall.test_processings)]:
+        results.append(measure(name, lambda: quiet(func, n1, n2), params, repeat))
+    ns = list(range(20_000, 52_000, 1_000))
+    for workers in sorted({1, os.cpu_count() or 1}):
+        results.append(measure("learn_parall.fib_batch",
+                               lambda: learn_parall.fib_batch(ns, method="iterative", max_workers=workers),
+                               {"inputs": len(ns), "workers": workers}, repeat, items=len(ns)))
+    for backend in learn_parall.ParallelExecutor.BACKENDS:
+        results.append(measure("learn_parall.parallel_map",
+                               lambda: learn_parall.parallel_map(learn_parall.fib_iterative, ns, backend),
+                               {"inputs": len(ns), "backend": backend}, repeat, items=len(ns)))
+    return results
+
+
+def quiet(func, *args):
+    '''Calls func with its progress prints suppressed.'''
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+def compare(results, baseline_file, threshold):
+    '''Prints the min-time ratio against a previous run and flags regressions above threshold.'''
+    with open(baseline_file, encoding="utf-8") as f:
+        baseline = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["results"]}
+    for result in results:
+        old = baseline.get((result["name"], json.dumps(result["params"], sort_keys=True)))
+        if old is None:
+            continue
+        ratio = result["min_s"] / old["min_s"]
+        flag = "  REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{result['name']:<32} {json.dumps(result['params']):<50} x{ratio:6.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="bench_results.json", help="JSON file for the results")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--only", choices=["markov", "parallel"], help="run a single group")
+    parser.add_argument("--fib", type=int, nargs=2, default=[100_000, 110_000], metavar=("N1", "N2"),
+                        help="Fibonacci arguments for the thread/process comparison")
+    parser.add_argument("--compare", help="previous JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    results = []
+    if args.only in (None, "markov"):
+        results += bench_markov_chain(args.repeat)
+    if args.only in (None, "parallel"):
+        results += bench_parallel(args.repeat, *args.fib)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "machine": machine_info(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
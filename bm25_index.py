@@ -0,0 +1,115 @@
+'''
+In-process BM25 inverted index for hybrid (keyword + vector) retrieval in learn_RAG.
+Postings are stored CSR-style in NumPy arrays (term -> doc ids / term frequencies), so scoring a
+query is a handful of vectorized array operations. Chinese text is tokenized with jieba when it is
+installed, otherwise with character bigrams; ASCII words such as part numbers stay whole tokens.
+'''
+
+import re
+from collections import Counter
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import jieba
+except ImportError:  # jieba is optional
+    jieba = None
+
+_ASCII_WORD = re.compile(r"[A-Za-z0-9]+(?:[_\-.][A-Za-z0-9]+)*")
+_CJK_RUN = re.compile(r"[一-鿿]+")
+
+
+def tokenize(text: str) -> List[str]:
+    '''Lower-cased ASCII words plus jieba words (or character bigrams) for CJK runs.'''
+    tokens = [word.lower() for word in _ASCII_WORD.findall(text)]
+    for run in _CJK_RUN.findall(text):
+        if jieba is not None:
+            tokens.extend(word for word in jieba.lcut_for_search(run) if word.strip())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    '''BM25 scores over array-backed postings; build() once, then search() many queries.'''
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.vocabulary = {}
+
+    def build(self, ids: Sequence[str], documents: Sequence[str]) -> "BM25Index":
+        self.ids = list(ids)
+        term_ids, doc_ids, tfs = [], [], []
+        doc_lengths = np.zeros(len(self.ids), dtype=np.float32)
+        for doc_id, document in enumerate(documents):
+            counts = Counter(tokenize(document))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                term_ids.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        self.postings_docs = np.asarray(doc_ids, dtype=np.int32)[order]
+        self.postings_tfs = np.asarray(tfs, dtype=np.float32)[order]
+        document_frequency = np.bincount(term_ids, minlength=len(self.vocabulary))
+        self.indptr = np.concatenate(([0], np.cumsum(document_frequency)))
+        self.doc_lengths = doc_lengths
+        self._finalize(document_frequency)
+        return self
+
+    def _finalize(self, document_frequency: np.ndarray) -> None:
+        n_docs = len(self.ids)
+        self.idf = np.log(1.0 + (n_docs - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        average_length = self.doc_lengths.mean() if n_docs else 1.0
+        # per-document part of the BM25 denominator, computed once
+        self.length_norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths / max(average_length, 1e-9))
+
+    def scores(self, query: str) -> np.ndarray:
+        '''BM25 score of every document for the query.'''
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, stop = self.indptr[term_id], self.indptr[term_id + 1]
+            docs, tfs = self.postings_docs[start:stop], self.postings_tfs[start:stop]
+            scores[docs] += self.idf[term_id] * tfs * (self.k1 + 1.0) / (tfs + self.length_norm[docs])
+        return scores
+
+    def search(self, query: str, top_k: int) -> Tuple[List[str], np.ndarray]:
+        '''Ids and scores of the top_k documents with a positive score, best first.'''
+        scores = self.scores(query)
+        top_k = min(top_k, int(np.count_nonzero(scores)))
+        if top_k == 0:
+            return [], np.empty(0, dtype=np.float32)
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [self.ids[i] for i in order], scores[order]
+
+    def save(self, path: str) -> None:
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        np.savez(
+            path, k1=self.k1, b=self.b,
+            ids=np.array(self.ids, dtype=str), terms=np.array(terms, dtype=str),
+            indptr=self.indptr, postings_docs=self.postings_docs, postings_tfs=self.postings_tfs,
+            doc_lengths=self.doc_lengths,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            index = cls(float(data["k1"]), float(data["b"]))
+            index.ids = data["ids"].tolist()
+            index.vocabulary = {term: i for i, term in enumerate(data["terms"].tolist())}
+            index.indptr = data["indptr"]
+            index.postings_docs = data["postings_docs"]
+            index.postings_tfs = data["postings_tfs"]
+            index.doc_lengths = data["doc_lengths"]
+        index._finalize(np.diff(index.indptr))
+        return index
@@ -0,0 +1,237 @@
+'''
+Structure-aware chunking shared by data_analysis (PDF pages) and learn_RAG (markdown files).
+Text is streamed page by page, split into heading / paragraph / sentence blocks and packed into
+chunks of at most chunk_size (characters or tokens). Every chunk keeps its source file, page and
+character offset in the original page text. Only markdown "#" and 第…章/节 lines count as headings, and
+a heading starts a new chunk only once the current one has reached min_chunk_size. Overlap is whole
+trailing blocks up to `overlap` units, and ChunkStats reports how much the overlap inflates the
+embedded volume.
+'''
+
+import copy
+import os
+import re
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+_BLOCK = re.compile(r"(?:[^\n]|\n(?![ \t]*\n))+")  # runs of text separated by blank lines
+# numbered lines ("1. 打开电源", "100 元") are list items and table rows far more often than headings
+_HEADING = re.compile(r"^\s*(#{1,6}\s|第[一二三四五六七八九十百千\d]+[章节])")
+_SENTENCE = re.compile(r"[^。！？!?；;\n]*[。！？!?；;\n]+|[^。！？!?；;\n]+$")
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")  # CJK characters and punctuation
+
+
+class Chunk(NamedTuple):
+    '''A chunk of text and where it starts: source file, 0-based page and character offset in that page.'''
+    text: str
+    source: str
+    page: int
+    offset: int
+
+
+@dataclass
+class ChunkStats:
+    '''Sizes are in the chunker's length unit (characters or tokens).'''
+    input_length: int = 0
+    output_length: int = 0
+    chunks: int = 0
+
+    @property
+    def amplification(self) -> float:
+        '''Embedded volume relative to the source text; 1.0 means no overlap overhead.'''
+        return self.output_length / self.input_length if self.input_length else 0.0
+
+    def merge(self, other: "ChunkStats") -> "ChunkStats":
+        self.input_length += other.input_length
+        self.output_length += other.output_length
+        self.chunks += other.chunks
+        return self
+
+
+@lru_cache(maxsize=None)
+def _token_encoder():
+    import tiktoken  # optional, only needed for length="tokens"
+    return tiktoken.get_encoding("cl100k_base")
+
+
+class _Block(NamedTuple):
+    text: str
+    page: int
+    offset: int
+    heading: bool
+
+
+def _join(lines: List[Tuple[str, int]]) -> Tuple[str, Callable[[int], int]]:
+    '''
+    Joins the stripped lines of a wrapped paragraph, given with their offsets in the page: with a space,
+    or with nothing between two CJK characters. Also returns a function mapping a position in the
+    joined text back to an offset in the page.
+    '''
+    parts, starts, origins, length = [], [], [], 0
+    for line, origin in lines:
+        if parts and not (_CJK.match(parts[-1][-1]) and _CJK.match(line[0])):
+            parts.append(" ")
+            length += 1
+        starts.append(length)
+        origins.append(origin)
+        parts.append(line)
+        length += len(line)
+
+    def position(i: int) -> int:
+        k = max(0, bisect_right(starts, i) - 1)
+        return origins[k] + i - starts[k]
+
+    return "".join(parts), position
+
+
+class Chunker:
+    def __init__(self, chunk_size: int = 1000, overlap: int = 0,
+                 length: Union[str, Callable[[str], int]] = "chars", separator: str = "\n\n",
+                 min_chunk_size: Optional[int] = None):
+        '''
+        :param chunk_size: Maximum chunk size in the length unit.
+        :param overlap: Trailing blocks totalling at most this size are repeated at the start of the
+            next chunk (never across a heading or a file boundary). 0 disables overlap.
+        :param length: "chars", "tokens" (tiktoken cl100k_base) or a picklable callable.
+        :param separator: Joins the blocks of one chunk.
+        :param min_chunk_size: A heading only ends the current chunk once it is at least this size,
+            so short sections are packed together. Defaults to a quarter of chunk_size.
+        '''
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.length = length
+        self.separator = separator
+        self.min_chunk_size = chunk_size // 4 if min_chunk_size is None else min_chunk_size
+        self.stats = ChunkStats()
+
+    def measure(self, text: str) -> int:
+        if self.length == "chars":
+            return len(text)
+        if self.length == "tokens":
+            return len(_token_encoder().encode(text))
+        return self.length(text)
+
+    def _blocks(self, text: str, page: int) -> Iterator[_Block]:
+        '''Headings and paragraphs of one page; oversized paragraphs are split by sentence, then hard.'''
+        for match in _BLOCK.finditer(text):
+            line_offset = match.start()
+            paragraph: List[Tuple[str, int]] = []
+            for line in match.group().split("\n"):
+                stripped = line.strip()
+                origin = line_offset + len(line) - len(line.lstrip())
+                if _HEADING.match(line):
+                    if paragraph:
+                        yield from self._fit(*_join(paragraph), page)
+                        paragraph = []
+                    yield _Block(stripped, page, origin, True)
+                elif stripped:
+                    paragraph.append((stripped, origin))
+                line_offset += len(line) + 1
+            if paragraph:
+                yield from self._fit(*_join(paragraph), page)
+
+    def _fit(self, text: str, position: Callable[[int], int], page: int) -> Iterator[_Block]:
+        '''Splits a paragraph into blocks of at most chunk_size; position maps text positions to page offsets.'''
+        if self.measure(text) <= self.chunk_size:
+            yield _Block(text, page, position(0), False)
+            return
+        piece, piece_start = "", 0
+        for match in _SENTENCE.finditer(text):
+            sentence = match.group()
+            if piece and self.measure(piece + sentence) > self.chunk_size:
+                yield _Block(piece, page, position(piece_start), False)
+                piece = ""
+            if not piece:
+                piece_start = match.start()
+            while self.measure(piece + sentence) > self.chunk_size:
+                # a single sentence longer than a chunk: cut it by characters
+                cut = max(1, len(sentence) * self.chunk_size // self.measure(sentence))
+                yield _Block(sentence[:cut], page, position(piece_start), False)
+                sentence = sentence[cut:]
+                piece_start += cut
+            piece += sentence
+        if piece:
+            yield _Block(piece, page, position(piece_start), False)
+
+    def chunk_pages(self, pages: Iterable[Tuple[str, int, str]]) -> Iterator[Chunk]:
+        '''
+        Chunks a stream of (file, page, text) records, e.g. pdf_ingest.iter_pdf_pages.
+        Only the blocks of the chunk being built are held in memory.
+        '''
+        current: List[_Block] = []
+        current_size, source = 0, None
+
+        def flush(keep_overlap: bool) -> Iterator[Chunk]:
+            nonlocal current, current_size
+            text = self.separator.join(block.text for block in current)
+            self.stats.output_length += self.measure(text)
+            self.stats.chunks += 1
+            yield Chunk(text, source, current[0].page, current[0].offset)
+            kept, kept_size = [], 0
+            if keep_overlap:
+                for block in reversed(current[1:]):
+                    block_size = self.measure(block.text)
+                    if block.heading or kept_size + block_size > self.overlap:
+                        break
+                    kept.insert(0, block)
+                    kept_size += block_size
+            current, current_size = kept, kept_size
+
+        for file, page, text in pages:
+            if file != source:
+                if current:
+                    yield from flush(keep_overlap=False)
+                current, current_size, source = [], 0, file
+            self.stats.input_length += self.measure(text)
+            for block in self._blocks(text, page):
+                block_size = self.measure(block.text)
+                section_break = block.heading and current_size >= self.min_chunk_size
+                if current and (section_break or current_size + block_size > self.chunk_size):
+                    yield from flush(keep_overlap=not block.heading)
+                    # drop overlap that would no longer leave room for the new block
+                    while current and current_size + block_size > self.chunk_size:
+                        current_size -= self.measure(current.pop(0).text)
+                current.append(block)
+                current_size += block_size
+        if current:
+            yield from flush(keep_overlap=False)
+
+    def chunk_text(self, text: str, source: str = "") -> List[Chunk]:
+        return list(self.chunk_pages([(source, 0, text)]))
+
+
+def read_pages(path: str) -> Iterator[Tuple[str, int, str]]:
+    '''(file, page, text) records of a PDF (one per page) or a text/markdown file (a single page).'''
+    if path.lower().endswith(".pdf"):
+        from PyPDF2 import PdfReader
+        for page_number, page in enumerate(PdfReader(path).pages):
+            yield path, page_number, page.extract_text() or ""
+    else:
+        with open(path, "r", encoding="UTF-8") as file:
+            yield path, 0, file.read()
+
+
+def _chunk_file(path: str, chunker: Chunker) -> Tuple[List[Chunk], ChunkStats]:
+    '''Worker: chunks one document with a fresh copy of the chunker.'''
+    chunker = copy.copy(chunker)
+    chunker.stats = ChunkStats()
+    chunks = list(chunker.chunk_pages(read_pages(path)))
+    return chunks, chunker.stats
+
+
+def chunk_files(paths: List[str], chunker: Chunker, max_workers: int | None = None) -> Tuple[List[Chunk], ChunkStats]:
+    '''Chunks several documents in parallel, one document per task; returns all chunks and combined stats.'''
+    stats = ChunkStats()
+    all_chunks: List[Chunk] = []
+    if len(paths) <= 1:
+        results = [_chunk_file(path, chunker) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers or min(len(paths), os.cpu_count() or 1)) as pool:
+            results = list(pool.map(_chunk_file, paths, [chunker] * len(paths)))
+    for chunks, file_stats in results:
+        all_chunks.extend(chunks)
+        stats.merge(file_stats)
+    return all_chunks, stats
@@ -0,0 +1,191 @@
+'''
+Columnar CSV loading for the CSV analysis tab in data_analysis.
+A CSV is parsed once per content hash with pyarrow's streaming (block-wise, multi-threaded) reader.
+Its columns are narrowed to compact types: dictionary-encoded low-cardinality strings, the smallest
+integer type that holds the values, and float32 where that is lossless. The result is cached as an
+uncompressed Arrow IPC file in csv_cache/. Loads memory-map that file, so null-free numeric columns are
+zero-copy views of the page cache instead of private heap copies. For files larger than memory,
+scan_csv returns a Polars LazyFrame over the same cache file instead of a DataFrame. Once the cache
+exceeds CACHE_MAX_BYTES, the least recently used files are removed.
+'''
+
+import hashlib
+import os
+from typing import BinaryIO, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+CACHE_DIR = "csv_cache"
+CACHE_MAX_BYTES = 4 << 30  # total size of csv_cache/ above which least recently used files are removed
+BLOCK_SIZE = 64 << 20  # bytes of CSV per parsed block
+CATEGORY_RATIO = 0.5   # dictionary-encode string columns with at most this share of distinct values
+INT_TYPES = (pa.int8(), pa.int16(), pa.int32(), pa.int64())
+
+
+def file_digest(file: BinaryIO, chunk_size: int = 1 << 20) -> str:
+    '''sha1 of a binary file object, read in chunks from the start; the file position is restored.'''
+    position = file.tell()
+    file.seek(0)
+    digest = hashlib.sha1()
+    while chunk := file.read(chunk_size):
+        digest.update(chunk)
+    file.seek(position)
+    return digest.hexdigest()
+
+
+def cache_path(digest: str, cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"{digest}.arrow")
+
+
+def read_ipc(path: str) -> pa.Table:
+    '''Memory-maps an Arrow IPC file; the table's buffers point into the mapping.'''
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def _parse(file: BinaryIO, path: str, column_types=None) -> None:
+    '''Streams the CSV block by block into an Arrow IPC file.'''
+    file.seek(0)
+    reader = pacsv.open_csv(
+        file,
+        read_options=pacsv.ReadOptions(block_size=BLOCK_SIZE),
+        convert_options=pacsv.ConvertOptions(column_types=column_types, strings_can_be_null=True),
+    )
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+
+
+def _column_names(file: BinaryIO):
+    file.seek(0)
+    return pacsv.open_csv(file, read_options=pacsv.ReadOptions(block_size=BLOCK_SIZE)).schema.names
+
+
+def _compact_type(column: pa.ChunkedArray, parse_numbers: bool = False) -> Tuple[pa.DataType, pa.Array]:
+    '''Compact type for a column, plus the dictionary to encode it with (or None).'''
+    column_type = column.type
+    if parse_numbers and pa.types.is_string(column_type):
+        # columns that were read as text because their type changed after the first block
+        for number_type in (pa.int64(), pa.float64()):
+            try:
+                return _compact_type(pc.cast(column, number_type))
+            except pa.ArrowInvalid:
+                pass
+    if pa.types.is_integer(column_type) and column.null_count < len(column):
+        low, high = (value.as_py() for value in pc.min_max(column).values())
+        for int_type in INT_TYPES:
+            info = np.iinfo(int_type.to_pandas_dtype())
+            if info.min <= low and high <= info.max:
+                return int_type, None
+    if pa.types.is_float64(column_type):
+        round_trip = pc.cast(pc.cast(column, pa.float32()), pa.float64())
+        if pc.all(pc.equal(round_trip, column)).as_py() is not False:
+            return pa.float32(), None
+    if pa.types.is_string(column_type) or pa.types.is_large_string(column_type):
+        dictionary = pc.drop_null(pc.unique(column))
+        if len(dictionary) <= CATEGORY_RATIO * len(column):
+            return pa.dictionary(pa.int32(), column_type), dictionary
+    return column_type, None
+
+
+def _compact_batch(batch: pa.RecordBatch, schema: pa.Schema, dictionaries: Dict[int, pa.Array]) -> pa.RecordBatch:
+    arrays = []
+    for i, field in enumerate(schema):
+        array = batch.column(i)
+        if i in dictionaries:
+            # one dictionary for the whole file, so every batch shares it
+            array = pa.DictionaryArray.from_arrays(pc.index_in(array, value_set=dictionaries[i]), dictionaries[i])
+        elif array.type != field.type:
+            array = pc.cast(array, field.type)
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def build_cache(file: BinaryIO, path: str) -> None:
+    '''Parses the CSV into a raw IPC file, then rewrites it with compact column types to path.'''
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    raw_path = path + ".raw"
+    parse_numbers = False
+    try:
+        _parse(file, raw_path)
+    except pa.ArrowInvalid:
+        # pyarrow infers column types from the first block; read everything as text and infer per column
+        _parse(file, raw_path, column_types={name: pa.string() for name in _column_names(file)})
+        parse_numbers = True
+
+    raw = read_ipc(raw_path)
+    fields, dictionaries = [], {}
+    for i, name in enumerate(raw.column_names):
+        column_type, dictionary = _compact_type(raw.column(i), parse_numbers)
+        fields.append(pa.field(name, column_type))
+        if dictionary is not None:
+            dictionaries[i] = dictionary
+    schema = pa.schema(fields)
+    with pa.OSFile(path + ".tmp", "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in raw.to_batches():
+            writer.write_batch(_compact_batch(batch, schema, dictionaries))
+    del raw
+    os.replace(path + ".tmp", path)
+    os.remove(raw_path)
+
+
+def evict_cache(cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES, keep: str = None) -> None:
+    '''Removes cache files, least recently used (mtime) first, until the rest fit in max_bytes; keep is never removed.'''
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".arrow") and entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if keep and os.path.samefile(path, keep):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            # still memory-mapped by another session on Windows; retried on the next build
+            continue
+        total -= size
+
+
+def ensure_cache(file: BinaryIO, digest: str = None, cache_dir: str = CACHE_DIR) -> str:
+    '''
+    Path of the cached IPC file for a CSV, parsing it only if csv_cache/ has no entry for its content hash.
+    A hit touches the file's mtime, which evict_cache uses as its last-used time.
+    '''
+    path = cache_path(digest or file_digest(file), cache_dir)
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        build_cache(file, path)
+        evict_cache(cache_dir, keep=path)
+    return path
+
+
+def load_csv(file: BinaryIO, digest: str = None, cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    '''
+    DataFrame of a CSV loaded from its cache file. Dictionary columns become pandas categories and
+    strings pyarrow-backed strings; split_blocks keeps each column its own block, so the mapped
+    numeric buffers are not copied into a 2-D block.
+    '''
+    path = ensure_cache(file, digest, cache_dir)
+    string_dtype = pd.StringDtype("pyarrow")
+    return read_ipc(path).to_pandas(
+        split_blocks=True,
+        types_mapper={pa.string(): string_dtype, pa.large_string(): string_dtype}.get,
+    )
+
+
+def scan_csv(file: BinaryIO, digest: str = None, cache_dir: str = CACHE_DIR):
+    '''
+    Polars LazyFrame over the cache file of a CSV. Queries only read the columns and rows they need,
+    and filters and aggregations run in Polars' vectorized engine; nothing is loaded until collect().
+    '''
+    import polars as pl  # optional, only needed for the lazy backend
+    return pl.scan_ipc(ensure_cache(file, digest, cache_dir))
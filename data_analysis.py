@@ -1,17 +1,34 @@
 import streamlit as st
 import pandas as pd
 import os
-from PyPDF2 import PdfReader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import json
+import warnings
+import hashlib
+from collections import Counter, defaultdict
+from itertools import chain, cycle, islice
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain.tools.retriever import create_retriever_tool
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_community.embeddings import DashScopeEmbeddings
 from langchain.chat_models import init_chat_model
 from langchain_experimental.tools import PythonAstREPLTool
+import numpy as np
 import matplotlib
 matplotlib.use('Agg')
+from pdf_ingest import iter_pdf_pages
+from chunking import Chunker
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from answer_cache import SemanticAnswerCache
+import faiss_store
+from csv_cache import file_digest, load_csv, scan_csv
 import os
 from dotenv import load_dotenv 
 load_dotenv(override=True)
@@ -161,19 +178,60 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# 初始化embeddings
+# embedding缓存条数上限：要覆盖全部已入库片段，IVF/SQ8索引重建和召回率评估才不会重新请求embedding接口
+EMBEDDING_CACHE_SIZE = 5_000_000
+
+# 初始化embeddings，相同文本的向量从本地缓存读取；LLM_PROVIDER=fake 时使用本地假embedding
 @st.cache_resource
 def init_embeddings():
-    return DashScopeEmbeddings(
+    if os.getenv("LLM_PROVIDER") == "fake":
+        return DeterministicFakeEmbedding(size=1536)
+    embeddings = DashScopeEmbeddings(
         model="text-embedding-v1", 
         dashscope_api_key=dashscope_api_key
     )
+    return CachedEmbeddings(embeddings, model="text-embedding-v1",
+                            cache=EmbeddingCache("embedding_cache.sqlite", max_entries=EMBEDDING_CACHE_SIZE))
+
+# 本地测试用的假模型：逐字流式输出固定回复，不调用工具
+# （GenericFakeChatModel 按空格切分，中文回复没有空格会变成一整块）
+class FakeChatModel(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+    
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for char in next(self.messages).content:
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=char))
+            if run_manager:
+                run_manager.on_llm_new_token(char, chunk=chunk)
+            yield chunk
 
-# 初始化LLM
+# 初始化LLM，设置 LLM_PROVIDER=fake 时使用本地假模型
 @st.cache_resource
 def init_llm():
+    if os.getenv("LLM_PROVIDER") == "fake":
+        return FakeChatModel(messages=cycle([AIMessage(content="这是本地测试模型的流式回复，用于检查界面的逐字输出效果。")]))
     return init_chat_model("deepseek-chat", model_provider="deepseek")
 
+# 把工具调用进度和LLM token实时写到聊天消息里
+class StreamHandler(BaseCallbackHandler):
+    def __init__(self, container):
+        self.container = container
+        self.text = ""
+    
+    def on_llm_new_token(self, token, **kwargs):
+        self.text += token
+        self.container.markdown(self.text + "▌")
+    
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self.text += f"\n\n🔧 正在调用工具 `{serialized.get('name', '')}` ...\n\n"
+        self.container.markdown(self.text)
+
+# 初始化语义答案缓存，PDF和CSV各用一个
+@st.cache_resource
+def init_answer_cache(name):
+    return SemanticAnswerCache(threshold=0.95, ttl=24 * 3600, max_entries=1000)
+
 # 初始化会话状态
 def init_session_state():
     if 'pdf_messages' not in st.session_state:
@@ -182,72 +240,327 @@ def init_session_state():
         st.session_state.csv_messages = []
     if 'df' not in st.session_state:
         st.session_state.df = None
+    if 'csv_version' not in st.session_state:
+        st.session_state.csv_version = None
+    if 'csv_file_id' not in st.session_state:
+        st.session_state.csv_file_id = None
+    if 'csv_backend' not in st.session_state:
+        st.session_state.csv_backend = None
+    if 'index_type' not in st.session_state:
+        st.session_state.index_type = "Flat"
+    if 'index_warnings' not in st.session_state:
+        st.session_state.index_warnings = []
 
 # PDF处理函数
 def pdf_read(pdf_doc):
-    text = ""
-    for pdf in pdf_doc:
-        pdf_reader = PdfReader(pdf)
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-    return text
-
-def get_chunks(text):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_text(text)
-    return chunks
-
-def vector_store(text_chunks):
+    """逐页流式返回 (file, page, text) 记录，页面在进程池中并行抽取"""
+    return iter_pdf_pages(pdf_doc)
+
+# 片段大小与重叠（字符数），重叠只复制完整的段落/句子块
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+
+def get_chunks(pages, chunker=None):
+    """按标题/段落/句子结构流式切分页面流，返回带来源、页码和偏移量的Document生成器"""
+    chunker = chunker or Chunker(CHUNK_SIZE, CHUNK_OVERLAP)
+    for chunk in chunker.chunk_pages(pages):
+        yield Document(page_content=chunk.text,
+                       metadata={"source": chunk.source, "page": chunk.page, "offset": chunk.offset})
+
+def chunk_id(doc):
+    """按来源文件和文本内容计算片段ID，相同内容重复上传时不会重复embedding"""
+    key = f"{doc.metadata.get('source', '')}\0{doc.page_content}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def load_database(writable=False):
+    """
+    默认以只读内存映射方式打开 faiss_db：多个进程共享页缓存、秒级启动，也不需要反序列化pickle。
+    writable=True 时把索引和片段读入内存，用于追加和删除。
+    """
+    embeddings = init_embeddings()
+    index, docstore, positions = faiss_store.load_store("faiss_db", use_mmap=not writable)
+    if not writable:
+        return FAISS(embeddings, index, docstore, positions)
+    ids = [doc_id.decode() for doc_id in docstore.ids()]
+    docs = {doc_id: docstore.search(position) for position, doc_id in enumerate(ids)}
+    return FAISS(embeddings, index, InMemoryDocstore(docs), dict(enumerate(ids)))
+
+def save_database(db):
+    """按索引顺序保存向量、片段ID和片段文本，并在 sources.json 中记录每个文档的片段数，方便界面列出文档而不必加载索引"""
+    ids = [db.index_to_docstore_id[i] for i in range(db.index.ntotal)]
+    sources = Counter()
+    
+    def records():
+        for doc_id in ids:
+            doc = db.docstore.search(doc_id)
+            sources[doc.metadata.get("source", "")] += 1
+            yield doc.page_content, doc.metadata
+    
+    faiss_store.write_store("faiss_db", db.index, ids, records())
+    with open("faiss_db/sources.json", "w", encoding="utf-8") as f:
+        json.dump(sources, f, ensure_ascii=False)
+
+# 新建需要训练的索引（IVF聚类/PQ码本/SQ取值范围）时先攒这么多片段的向量，之后按批次追加
+TRAIN_SIZE = 32768
+
+def new_chunks(text_chunks, known, seen=None):
+    """过滤掉已在索引中的片段，返回 (片段ID, Document) 流；seen 按来源文件记录本次出现的全部片段ID"""
+    for doc in text_chunks:
+        doc_id = chunk_id(doc)
+        if seen is not None:
+            seen[doc.metadata.get("source", "")].add(doc_id)
+        if doc_id not in known:
+            known.add(doc_id)
+            yield doc_id, doc
+
+def embed_batches(items, batch_size=256):
+    """按批次embedding (片段ID, Document) 流，每批返回 (片段ID列表, Document列表, float32向量矩阵)"""
+    embeddings = init_embeddings()
+    items = iter(items)
+    while batch := list(islice(items, batch_size)):
+        docs = [doc for _, doc in batch]
+        vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in docs]), dtype=np.float32)
+        yield [doc_id for doc_id, _ in batch], docs, vectors
+
+def stored_batches(db, drop_ids=frozenset(), batch_size=1024):
+    """
+    已入库片段按索引顺序分批返回 (片段ID列表, Document列表, float32向量矩阵)，跳过 drop_ids 中的片段。
+    Flat/HNSW 直接从索引还原原始向量；SQ8只能还原出量化后的近似值，用它重建会把误差固化进新索引、
+    每次删除再累积一次，所以SQ8和IVF类型都从embedding缓存取原始向量，被缓存淘汰的片段会重新请求。
+    """
+    ids = db.docstore.ids()
+    reconstruct = faiss_store.can_reconstruct(db.index)
     embeddings = init_embeddings()
-    vector_store = FAISS.from_texts(text_chunks, embedding=embeddings)
-    vector_store.save_local("faiss_db")
+    for start in range(0, db.index.ntotal, batch_size):
+        stop = min(start + batch_size, db.index.ntotal)
+        batch_ids = [doc_id.decode() for doc_id in ids[start:stop]]
+        keep = [i for i, doc_id in enumerate(batch_ids) if doc_id not in drop_ids]
+        if not keep:
+            continue
+        docs = [db.docstore.search(start + i) for i in keep]
+        if reconstruct:
+            vectors = db.index.reconstruct_n(start, stop - start)[keep]
+        else:
+            vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in docs]), dtype=np.float32)
+        yield [batch_ids[i] for i in keep], docs, vectors
+
+def add_to_database(db, batches, index_type="Flat"):
+    """
+    把 (片段ID列表, Document列表, 向量矩阵) 批次写入db，返回 (db, 新增片段数)。
+    db 为 None 时新建 index_type 类型的FAISS索引；只有需要训练的类型才先攒 TRAIN_SIZE 个向量用于训练，
+    Flat/HNSW 从第一批开始就直接写入。
+    """
+    if db is None:
+        held, held_count = [], 0
+        for batch in batches:
+            held.append(batch)
+            held_count += len(batch[0])
+            if not faiss_store.needs_training(index_type) or held_count >= TRAIN_SIZE:
+                break
+        if not held:
+            return None, 0
+        index = faiss_store.train_index(index_type, np.concatenate([vectors for _, _, vectors in held]))
+        db = FAISS(init_embeddings(), index, InMemoryDocstore(), {})
+        batches = chain(held, batches)
+    added = 0
+    for ids, docs, vectors in batches:
+        db.add_embeddings(zip([doc.page_content for doc in docs], vectors),
+                          metadatas=[doc.metadata for doc in docs], ids=ids)
+        added += len(ids)
+    return db, added
+
+def vector_store(text_chunks, batch_size=256, incremental=True, index_type="Flat"):
+    """
+    按批次消费chunk流写入FAISS，返回 (本次新增embedding的片段数, 删除的过期片段数)。
+    incremental=True 时在已有的 faiss_db 上追加，已存在的片段（按内容哈希）直接跳过；
+    重新上传的文档中不再出现的旧片段（同名文档内容已修改）会被删除，检索不到过期内容。
+    index_type 只在新建索引时生效，已有索引沿用原来的类型。
+    """
+    db = load_database(writable=True) if incremental and check_database_exists() else None
+    known = set(db.index_to_docstore_id.values()) if db is not None else set()
+    seen = defaultdict(set)
+    db, added = add_to_database(db, embed_batches(new_chunks(text_chunks, known, seen), batch_size), index_type)
+    stale = [doc_id for doc_id, doc in db.docstore._dict.items()
+             if doc_id not in seen.get(doc.metadata.get("source", ""), (doc_id,))] if db is not None else []
+    index_type = faiss_store.index_kind(db.index) if db is not None else index_type
+    if stale and index_type == "Flat":
+        db.delete(stale)
+    if added or stale:
+        save_database(db)
+    if stale and index_type != "Flat":
+        # IVF删除后ID不再连续、HNSW不支持删除，按原类型重建
+        rebuild_database(index_type, drop_ids=set(stale))
+    return added, len(stale)
+
+def rebuild_database(index_type, drop_ids=frozenset()):
+    """
+    用 index_type 重新训练并重建索引（可同时去掉 drop_ids 中的片段），返回保留的片段数。
+    向量尽量从现有索引还原，见 stored_batches。
+    """
+    db = load_database()
+    db, kept = add_to_database(None, stored_batches(db, drop_ids), index_type)
+    if not kept:
+        import shutil
+        shutil.rmtree("faiss_db")
+        return 0
+    save_database(db)
+    return kept
+
+def delete_document(source):
+    """只删除某个文档的片段，其余索引保持不变"""
+    db = load_database(writable=True)
+    ids = [doc_id for doc_id, doc in db.docstore._dict.items() if doc.metadata.get("source") == source]
+    if not ids:
+        return 0
+    index_type = faiss_store.index_kind(db.index)
+    if index_type != "Flat":
+        # IVF删除后ID不再连续、HNSW不支持删除，按原类型重建
+        rebuild_database(index_type, drop_ids=set(ids))
+        return len(ids)
+    db.delete(ids)
+    if db.index.ntotal == 0:
+        import shutil
+        shutil.rmtree("faiss_db")
+    else:
+        save_database(db)
+    return len(ids)
+
+def index_recall_report(k=10, n_queries=200):
+    """
+    当前索引在不同 nprobe/efSearch 下的召回率和单次查询延迟，以精确Flat检索为基准。
+    基准用的原始向量由 stored_batches 提供。
+    """
+    db = load_database()
+    vectors = np.concatenate([vectors for _, _, vectors in stored_batches(db)])
+    return pd.DataFrame(faiss_store.recall_report(db.index, vectors, k=k, n_queries=n_queries))
+
+def list_documents():
+    """返回已入库文档及其片段数"""
+    if not os.path.exists("faiss_db/sources.json"):
+        return {}
+    with open("faiss_db/sources.json", encoding="utf-8") as f:
+        return json.load(f)
 
 def check_database_exists():
-    return os.path.exists("faiss_db") and os.path.exists("faiss_db/index.faiss")
+    return faiss_store.store_exists("faiss_db")
+
+def migrate_legacy_database():
+    """把旧版本 save_local 保存的 index.pkl 转成内存映射格式，只执行一次"""
+    if os.path.exists("faiss_db/index.pkl") and not check_database_exists():
+        db = FAISS.load_local("faiss_db", init_embeddings(), allow_dangerous_deserialization=True)
+        save_database(db)
+        os.remove("faiss_db/index.pkl")
+
+def database_version():
+    """索引版本号：vector_store/delete_document 每次保存都会写一个新的版本目录，CURRENT 指向当前版本"""
+    return faiss_store.store_version("faiss_db")
+
+# 进程内缓存索引和检索引擎，只有索引版本变化时才重新加载FAISS并重建agent
+@st.cache_resource(max_entries=1)
+def get_database(index_version):
+    return load_database()
+
+# 每组检索参数各有一个agent；参数随每次查询传给共享的索引，不同会话的设置互不影响
+@st.cache_resource(max_entries=8)
+def get_pdf_agent(index_version, nprobe=None, ef_search=None):
+    llm = init_llm()
+    
+    db = get_database(index_version)
+    index = faiss_store.SearchView(db.index, nprobe=nprobe, ef_search=ef_search)
+    new_db = FAISS(db.embedding_function, index, db.docstore, db.index_to_docstore_id)
+    retriever = new_db.as_retriever()
+    
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", """你是AI助手，请根据提供的上下文回答问题，确保提供所有细节，如果答案不在上下文中，请说"答案不在上下文中"，不要提供错误的答案"""),
+        ("placeholder", "{chat_history}"),
+        ("human", "{input}"),
+        ("placeholder", "{agent_scratchpad}"),
+    ])
+    
+    retrieval_chain = create_retriever_tool(retriever, "pdf_extractor", "This tool is to give answer to queries from the pdf")
+    agent = create_tool_calling_agent(llm, [retrieval_chain], prompt)
+    return AgentExecutor(agent=agent, tools=[retrieval_chain], verbose=True)
 
-def get_pdf_response(user_question):
+def get_pdf_response(user_question, callbacks=None, nprobe=None, ef_search=None):
     if not check_database_exists():
         return "❌ 请先上传PDF文件并点击'Submit & Process'按钮来处理文档！"
     
     try:
-        embeddings = init_embeddings()
-        llm = init_llm()
+        # 同一索引版本和检索参数下的相似问题直接返回缓存的答案
+        version = database_version()
+        cache_key = (version, nprobe, ef_search)
+        answer_cache = init_answer_cache("pdf")
+        question_vector = init_embeddings().embed_query(user_question)
+        if (cached := answer_cache.lookup(question_vector, cache_key)) is not None:
+            return cached
         
-        new_db = FAISS.load_local("faiss_db", embeddings, allow_dangerous_deserialization=True)
-        retriever = new_db.as_retriever()
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """你是AI助手，请根据提供的上下文回答问题，确保提供所有细节，如果答案不在上下文中，请说"答案不在上下文中"，不要提供错误的答案"""),
-            ("placeholder", "{chat_history}"),
-            ("human", "{input}"),
-            ("placeholder", "{agent_scratchpad}"),
-        ])
-        
-        retrieval_chain = create_retriever_tool(retriever, "pdf_extractor", "This tool is to give answer to queries from the pdf")
-        agent = create_tool_calling_agent(llm, [retrieval_chain], prompt)
-        agent_executor = AgentExecutor(agent=agent, tools=[retrieval_chain], verbose=True)
-        
-        response = agent_executor.invoke({"input": user_question})
+        agent_executor = get_pdf_agent(version, nprobe, ef_search)
+        response = agent_executor.invoke({"input": user_question}, config={"callbacks": callbacks})
+        answer_cache.store(question_vector, cache_key, response['output'])
         return response['output']
         
     except Exception as e:
         return f"❌ 处理问题时出错: {str(e)}"
 
 # CSV处理函数
-def get_csv_response(query: str) -> str:
+def is_lazy_frame(df):
+    """Polars LazyFrame（大数据模式）还是 pandas DataFrame"""
+    return hasattr(df, "collect_schema")
+
+def csv_preview(df, n=5):
+    """前 n 行，统一返回 pandas DataFrame；LazyFrame 只读取这几行"""
+    return df.head(n).collect().to_pandas() if is_lazy_frame(df) else df.head(n)
+
+def csv_info(df):
+    """(行数, 列数, 列名, 数据类型)；LazyFrame 的行数由引擎计算，不加载数据"""
+    if is_lazy_frame(df):
+        import polars as pl
+        schema = df.collect_schema()
+        return df.select(pl.len()).collect().item(), len(schema), schema.names(), [str(dtype) for dtype in schema.dtypes()]
+    return df.shape[0], df.shape[1], list(df.columns), [str(dtype) for dtype in df.dtypes]
+
+PANDAS_PROMPT = """Given a pandas dataframe `df` answer user's query.
+    Here's the output of `df.head().to_markdown()` for your reference, you have access to full dataframe as `df`:
+    ```
+    {head}
+    ```
+    Give final answer as soon as you have enough data, otherwise generate code using `df` and call required tool."""
+
+POLARS_PROMPT = """Given a polars LazyFrame `df` answer user's query; polars is imported as `pl`.
+    Here's the output of `df.head().collect()` for your reference:
+    ```
+    {head}
+    ```
+    `df` may be larger than memory. Build the whole query lazily with `filter`, `select`, `with_columns`,
+    `group_by(...).agg(...)`, `sort` and `head`, and call `.collect(engine="streaming")` only on the final,
+    already reduced result, e.g. `df.group_by("city").agg(pl.col("age").mean()).collect(engine="streaming")`.
+    Never collect the full table; use `df.describe()` for summary statistics and `df.select(pl.len()).collect()` to count rows.
+    For plots, collect the aggregated data first and convert it with `.to_pandas()`.
+    Give final answer as soon as you have enough data, otherwise generate code using `df` and call required tool."""
+
+def get_csv_response(query: str, callbacks=None) -> str:
     if st.session_state.df is None:
         return "请先上传CSV文件"
     
+    # 同一份数据上的相似问题直接返回缓存的答案
+    answer_cache = init_answer_cache("csv")
+    question_vector = init_embeddings().embed_query(query)
+    if (cached := answer_cache.lookup(question_vector, st.session_state.csv_version)) is not None:
+        return cached
+    
     llm = init_llm()
-    locals_dict = {'df': st.session_state.df}
+    df = st.session_state.df
+    locals_dict = {'df': df}
+    # 大数据模式下 df 是惰性的 Polars LazyFrame，过滤和聚合下推给Polars引擎执行
+    if is_lazy_frame(df):
+        import polars as pl
+        locals_dict['pl'] = pl
+        intro = POLARS_PROMPT.format(head=csv_preview(df).to_markdown())
+    else:
+        intro = PANDAS_PROMPT.format(head=df.head().to_markdown())
     tools = [PythonAstREPLTool(locals=locals_dict)]
     
-    system = f"""Given a pandas dataframe `df` answer user's query.
-    Here's the output of `df.head().to_markdown()` for your reference, you have access to full dataframe as `df`:
-    ```
-    {st.session_state.df.head().to_markdown()}
-    ```
-    Give final answer as soon as you have enough data, otherwise generate code using `df` and call required tool.
+    system = f"""{intro}
     If user asks you to make a graph, save it as `plot.png`, and output GRAPH:<graph title>.
     Example:
     ```
@@ -269,10 +582,15 @@ def get_csv_response(query: str) -> str:
     agent = create_tool_calling_agent(llm=llm, tools=tools, prompt=prompt)
     agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
     
-    return agent_executor.invoke({"input": query})['output']
+    output = agent_executor.invoke({"input": query}, config={"callbacks": callbacks})['output']
+    # 图表答案依赖当前的 plot.png，不缓存
+    if "GRAPH" not in str(output):
+        answer_cache.store(question_vector, st.session_state.csv_version, output)
+    return output
 
 def main():
     init_session_state()
+    migrate_legacy_database()
     
     # 主标题
     st.markdown('<h1 class="main-header">🤖 LangChain B站公开课 By九天Hector</h1>', unsafe_allow_html=True)
@@ -293,6 +611,7 @@ def main():
                 st.markdown('<div class="info-card success-card"><span class="status-indicator status-ready">✅ PDF数据库已准备就绪</span></div>', unsafe_allow_html=True)
             else:
                 st.markdown('<div class="info-card warning-card"><span class="status-indicator status-waiting">⚠️ 请先上传并处理PDF文件</span></div>', unsafe_allow_html=True)
+            st.caption(f"💾 答案缓存命中率: {init_answer_cache('pdf').hit_rate():.0%}")
             
             # 聊天界面
             for message in st.session_state.pdf_messages:
@@ -306,9 +625,12 @@ def main():
                     st.markdown(pdf_query)
                 
                 with st.chat_message("assistant"):
-                    with st.spinner("🤔 AI正在分析文档..."):
-                        response = get_pdf_response(pdf_query)
-                    st.markdown(response)
+                    placeholder = st.empty()
+                    placeholder.markdown("🤔 AI正在分析文档...")
+                    response = get_pdf_response(pdf_query, callbacks=[StreamHandler(placeholder)],
+                                                nprobe=st.session_state.get("nprobe"),
+                                                ef_search=st.session_state.get("ef_search"))
+                    placeholder.markdown(response)
                     st.session_state.pdf_messages.append({"role": "assistant", "content": response})
         
         with col2:
@@ -331,15 +653,23 @@ def main():
             if st.button("🚀 上传并处理PDF文档", disabled=not pdf_docs, use_container_width=True):
                 with st.spinner("📊 正在处理PDF文件..."):
                     try:
-                        raw_text = pdf_read(pdf_docs)
-                        if not raw_text.strip():
-                            st.error("❌ 无法从PDF中提取文本")
+                        chunker = Chunker(CHUNK_SIZE, CHUNK_OVERLAP)
+                        text_chunks = get_chunks(pdf_read(pdf_docs), chunker)
+                        with warnings.catch_warnings(record=True) as caught:
+                            warnings.simplefilter("always")
+                            chunk_count, stale_count = vector_store(text_chunks, index_type=st.session_state.index_type)
+                        st.session_state.index_warnings = [str(w.message) for w in caught]
+                        if not chunk_count and not stale_count:
+                            if check_database_exists():
+                                st.info("ℹ️ 文档内容已全部在索引中，无需重新处理")
+                            else:
+                                st.error("❌ 无法从PDF中提取文本")
                             return
                         
-                        text_chunks = get_chunks(raw_text)
-                        st.info(f"📝 文本已分割为 {len(text_chunks)} 个片段")
+                        st.info(f"📝 新增 {chunk_count} 个文本片段（重叠放大系数 {chunker.stats.amplification:.2f}）")
+                        if stale_count:
+                            st.info(f"🧹 删除 {stale_count} 个已修改文档中的过期片段")
                         
-                        vector_store(text_chunks)
                         st.success("✅ PDF处理完成！")
                         st.balloons()
                         st.rerun()
@@ -347,6 +677,57 @@ def main():
                     except Exception as e:
                         st.error(f"❌ 处理PDF时出错: {str(e)}")
             
+            # 已入库文档，可单独删除
+            indexed_docs = list_documents()
+            if indexed_docs:
+                doc_to_delete = st.selectbox(
+                    "📚 已入库文档",
+                    list(indexed_docs),
+                    format_func=lambda name: f"{name} ({indexed_docs[name]} 个片段)"
+                )
+                if st.button("➖ 删除所选文档", use_container_width=True):
+                    try:
+                        removed = delete_document(doc_to_delete)
+                        st.success(f"已删除 {removed} 个片段")
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"删除失败: {e}")
+            
+            # 索引类型与检索参数
+            with st.expander("⚙️ 索引设置"):
+                st.selectbox(
+                    "索引类型",
+                    faiss_store.INDEX_TYPES,
+                    key="index_type",
+                    help="新建或重建索引时使用；IVF-PQ/SQ8 压缩向量以节省内存，IVF/HNSW 以少量召回率换取检索速度"
+                )
+                if check_database_exists():
+                    index = get_database(database_version()).index
+                    st.caption(f"当前索引: {faiss_store.index_kind(index)}，{index.ntotal} 个向量")
+                    # 例如片段太少、无法训练所选类型而改用Flat
+                    for message in st.session_state.index_warnings:
+                        st.warning(f"⚠️ {message}")
+                    search_params = faiss_store.get_search_params(index)
+                    if "nprobe" in search_params:
+                        st.number_input("nprobe（每次查询访问的倒排列表数）", 1, search_params["nlist"],
+                                        min(16, search_params["nlist"]), key="nprobe")
+                    if "ef_search" in search_params:
+                        st.number_input("efSearch（HNSW候选列表大小）", 1, 1024, 64, key="ef_search")
+                    if st.button("🔁 按所选类型重建索引", use_container_width=True):
+                        with st.spinner("正在训练并重建索引..."):
+                            try:
+                                with warnings.catch_warnings(record=True) as caught:
+                                    warnings.simplefilter("always")
+                                    kept = rebuild_database(st.session_state.index_type)
+                                st.session_state.index_warnings = [str(w.message) for w in caught]
+                                st.success(f"已重建，共 {kept} 个片段")
+                                st.rerun()
+                            except Exception as e:
+                                st.error(f"重建失败: {e}")
+                    if st.button("📈 召回率/延迟评估", use_container_width=True):
+                        with st.spinner("正在与精确检索对比..."):
+                            st.dataframe(index_recall_report(), hide_index=True)
+            
             # 清除数据库
             if st.button("🗑️ 清除PDF数据库", use_container_width=True):
                 try:
@@ -354,6 +735,7 @@ def main():
                     if os.path.exists("faiss_db"):
                         shutil.rmtree("faiss_db")
                     st.session_state.pdf_messages = []
+                    st.session_state.index_warnings = []
                     st.success("数据库已清除")
                     st.rerun()
                 except Exception as e:
@@ -371,6 +753,7 @@ def main():
                 st.markdown('<div class="info-card success-card"><span class="status-indicator status-ready">✅ 数据已加载完成</span></div>', unsafe_allow_html=True)
             else:
                 st.markdown('<div class="info-card warning-card"><span class="status-indicator status-waiting">⚠️ 请先上传CSV文件</span></div>', unsafe_allow_html=True)
+            st.caption(f"💾 答案缓存命中率: {init_answer_cache('csv').hit_rate():.0%}")
             
             # 聊天界面
             for message in st.session_state.csv_messages:
@@ -391,8 +774,10 @@ def main():
                     st.markdown(csv_query)
                 
                 with st.chat_message("assistant"):
-                    with st.spinner("🔄 正在分析数据..."):
-                        response = get_csv_response(csv_query)
+                    placeholder = st.empty()
+                    placeholder.markdown("🔄 正在分析数据...")
+                    response = get_csv_response(csv_query, callbacks=[StreamHandler(placeholder)])
+                    placeholder.empty()
                     
                     if isinstance(response, pd.DataFrame):
                         st.dataframe(response)
@@ -410,37 +795,59 @@ def main():
         with col2:
             st.markdown("### 📊 数据管理")
             
+            # 大数据模式：不把数据读入内存，agent 通过 Polars LazyFrame 查询
+            st.toggle(
+                "🐻‍❄️ 大数据模式（Polars 惰性查询）",
+                key="csv_lazy",
+                help="适合超过内存的大文件：过滤和聚合由Polars引擎按需扫描缓存文件执行"
+            )
+            backend = "polars" if st.session_state.csv_lazy else "pandas"
+            
             # CSV文件上传
             csv_file = st.file_uploader("📈 上传CSV文件", type='csv')
             if csv_file:
-                st.session_state.df = pd.read_csv(csv_file)
+                # 同一个上传文件只处理一次；内容哈希相同的文件直接从 csv_cache 内存映射加载，不再解析
+                if (csv_file.file_id, backend) != (st.session_state.csv_file_id, st.session_state.csv_backend):
+                    digest = file_digest(csv_file)
+                    if (digest, backend) != (st.session_state.csv_version, st.session_state.csv_backend):
+                        with st.spinner("📊 正在解析CSV..."):
+                            load = scan_csv if backend == "polars" else load_csv
+                            st.session_state.df = load(csv_file, digest)
+                        st.session_state.csv_version = digest
+                        st.session_state.csv_backend = backend
+                    st.session_state.csv_file_id = csv_file.file_id
                 st.success(f"✅ 数据加载成功!")
                 
                 # 显示数据预览
                 with st.expander("👀 数据预览", expanded=True):
-                    st.dataframe(st.session_state.df.head())
-                    st.write(f"📏 数据维度: {st.session_state.df.shape[0]} 行 × {st.session_state.df.shape[1]} 列")
+                    rows, columns, _, _ = csv_info(st.session_state.df)
+                    st.dataframe(csv_preview(st.session_state.df))
+                    st.write(f"📏 数据维度: {rows} 行 × {columns} 列")
             
             # 数据信息
             if st.session_state.df is not None:
                 if st.button("📋 显示数据信息", use_container_width=True):
                     with st.expander("📊 数据统计信息", expanded=True):
+                        rows, columns, names, dtypes = csv_info(st.session_state.df)
                         st.write("**基本信息:**")
-                        st.text(f"行数: {st.session_state.df.shape[0]}")
-                        st.text(f"列数: {st.session_state.df.shape[1]}")
+                        st.text(f"行数: {rows}")
+                        st.text(f"列数: {columns}")
                         st.write("**列名:**")
-                        st.write(list(st.session_state.df.columns))
+                        st.write(names)
                         st.write("**数据类型:**")
                         # 修复：将dtypes转换为字符串格式显示
                         dtype_info = pd.DataFrame({
-                            '列名': st.session_state.df.columns,
-                            '数据类型': [str(dtype) for dtype in st.session_state.df.dtypes]
+                            '列名': names,
+                            '数据类型': dtypes
                         })
                         st.dataframe(dtype_info, use_container_width=True)
             
             # 清除数据
             if st.button("🗑️ 清除CSV数据", use_container_width=True):
                 st.session_state.df = None
+                st.session_state.csv_version = None
+                st.session_state.csv_file_id = None
+                st.session_state.csv_backend = None
                 st.session_state.csv_messages = []
                 if os.path.exists('plot.png'):
                     os.remove('plot.png')
@@ -0,0 +1,141 @@
+'''
+Persistent embedding cache shared by data_analysis (DashScope) and learn_RAG (SentenceTransformer).
+Vectors are stored as float32 blobs in SQLite, keyed by (model name, hash of the normalized text),
+with size-bounded LRU eviction and hit/miss counters.
+'''
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    '''NFKC-normalizes the text and collapses whitespace so trivial edits hit the same entry.'''
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    '''On-disk (model, text hash) -> float32 vector cache with LRU eviction.'''
+
+    _BATCH = 500  # stay under SQLite's host parameter limit
+
+    def __init__(self, path: str = "embedding_cache.sqlite", max_entries: int = 1_000_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (model, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        '''Returns the cached vector for each text, or None on a miss.'''
+        keys = [text_hash(text) for text in texts]
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), self._BATCH):
+                batch = list(set(keys[i:i + self._BATCH]))
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                found.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                [(now, model, key) for key in found],
+            )
+            self._conn.commit()
+            result = [found.get(key) for key in keys]
+            hit_count = sum(vector is not None for vector in result)
+            # the cache is shared between Streamlit threads; count under the lock so no update is lost
+            self.hits += hit_count
+            self.misses += len(result) - hit_count
+        return result
+
+    def put_many(self, model: str, texts: Sequence[str], vectors) -> None:
+        '''Stores vectors for texts, evicting the least recently used entries above max_entries.'''
+        now = time.time()
+        rows = [
+            (model, text_hash(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            self._size += self._conn.total_changes - before
+            if self._size > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (self._size - self.max_entries,),
+                )
+                self._size = self.max_entries
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._size,
+        }
+
+
+def cached_encode(cache: EmbeddingCache, model: str, texts: Sequence[str],
+                  encode: Callable[[List[str]], Sequence]) -> np.ndarray:
+    '''
+    Returns a float32 (len(texts), dim) matrix, calling `encode` only for texts missing from the cache.
+    Duplicate texts within one call are encoded once.
+    '''
+    cached = cache.get_many(model, texts)
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+    if missing:
+        encoded = np.asarray(encode(missing), dtype=np.float32)
+        cache.put_many(model, missing, encoded)
+        by_text = dict(zip(missing, encoded))
+        cached = [by_text[text] if vector is None else vector for text, vector in zip(texts, cached)]
+    if not cached:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.vstack(cached)
+
+
+class CachedEmbeddings(Embeddings):
+    '''LangChain Embeddings wrapper that serves repeated texts from an EmbeddingCache.'''
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return cached_encode(self.cache, self.model, texts, self.embeddings.embed_documents).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        # 部分模型（如DashScope）对query和document使用不同的text_type，分开缓存
+        return cached_encode(
+            self.cache, f"{self.model}:query", [text], lambda t: [self.embeddings.embed_query(t[0])]
+        )[0].tolist()
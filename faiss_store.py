@@ -0,0 +1,329 @@
+'''
+FAISS index types for the PDF vector store in data_analysis.
+Besides the exact flat index, IVF-Flat, IVF-PQ, HNSW and scalar-quantized (SQ8) indexes are built with
+faiss.index_factory and trained on the first batch of vectors. IVF-PQ stores 1/64 and SQ8 1/4 of the
+float32 vector memory. nprobe / efSearch trade recall for latency at query time, and recall_report
+measures that trade-off against exact search.
+
+On disk a store is a directory of generations. Each generation is a subdirectory with the FAISS index
+(memory-mapped read-only when serving), the chunk ids (ids.npy) and the chunk records in chunks.bin,
+addressed by the byte offsets in offsets.npy. The CURRENT file names the live generation and is switched
+in one os.replace, so a reader never pairs files of different saves. Every Streamlit process maps the
+same files and shares the page cache, and nothing is unpickled.
+'''
+
+import json
+import math
+import mmap
+import os
+import shutil
+import time
+import warnings
+from collections.abc import Mapping
+from timeit import default_timer as timer
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+INDEX_TYPES = ("Flat", "IVF-Flat", "IVF-PQ", "HNSW", "SQ8")
+
+# fewest training vectors for which an index type is worth building: IVF wants >= 39 points per
+# list for k-means, PQ additionally 39 * 256 for its 8-bit codebooks
+MIN_TRAIN = {"Flat": 0, "IVF-Flat": 39 * 8, "IVF-PQ": 39 * 256, "HNSW": 0, "SQ8": 1}
+
+
+def needs_training(index_type: str) -> bool:
+    '''Whether an index type learns from data (IVF centroids, PQ codebooks, SQ value ranges) before vectors are added.'''
+    return index_type in ("IVF-Flat", "IVF-PQ", "SQ8")
+
+
+def choose_nlist(n_train: int) -> int:
+    '''About 4 * sqrt(n) inverted lists, but never fewer than 39 training points per list.'''
+    return max(1, min(int(4 * math.sqrt(n_train)), n_train // 39))
+
+
+def choose_pq_m(dim: int) -> int:
+    '''Largest number of PQ sub-quantizers that divides dim with at least 16 dimensions each.'''
+    for m in range(max(1, dim // 16), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def factory_string(index_type: str, dim: int, n_train: int, nlist: Optional[int] = None,
+                   pq_m: Optional[int] = None, hnsw_m: int = 32) -> str:
+    nlist = nlist or choose_nlist(n_train)
+    return {
+        "Flat": "Flat",
+        "IVF-Flat": f"IVF{nlist},Flat",
+        "IVF-PQ": f"IVF{nlist},PQ{pq_m or choose_pq_m(dim)}",
+        "HNSW": f"HNSW{hnsw_m}",
+        "SQ8": "SQ8",
+    }[index_type]
+
+
+def train_index(index_type: str, vectors: np.ndarray, nlist: Optional[int] = None,
+                pq_m: Optional[int] = None, hnsw_m: int = 32) -> faiss.Index:
+    '''
+    Returns an empty index of index_type trained on vectors (L2 metric, like LangChain's default).
+    Falls back to a flat index when there are too few vectors to train the requested type.
+    '''
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_train, dim = vectors.shape
+    if n_train < MIN_TRAIN[index_type]:
+        warnings.warn(f"{n_train} vectors are too few to train {index_type} "
+                      f"(need {MIN_TRAIN[index_type]}), using a flat index")
+        index_type = "Flat"
+    index = faiss.index_factory(dim, factory_string(index_type, dim, n_train, nlist, pq_m, hnsw_m))
+    if not index.is_trained:
+        index.train(vectors)
+    return index
+
+
+def index_kind(index: faiss.Index) -> str:
+    '''Which of INDEX_TYPES an index (e.g. one read back from disk) is.'''
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "HNSW"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "IVF-PQ"
+    if isinstance(index, faiss.IndexIVF):
+        return "IVF-Flat"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "SQ8"
+    return "Flat"
+
+
+def can_reconstruct(index: faiss.Index) -> bool:
+    '''
+    Whether index.reconstruct_n returns the original vectors cheaply (Flat and HNSW). SQ8 only returns
+    them to within its 8-bit quantization step, and IVF indexes would need a direct map.
+    '''
+    return index_kind(index) in ("Flat", "HNSW")
+
+
+def get_search_params(index: faiss.Index) -> Dict[str, int]:
+    '''The query-time knobs of an index and their current values ({} for Flat and SQ8).'''
+    kind = index_kind(index)
+    if kind.startswith("IVF"):
+        ivf = faiss.extract_index_ivf(index)
+        return {"nprobe": ivf.nprobe, "nlist": ivf.nlist}
+    if kind == "HNSW":
+        return {"ef_search": faiss.downcast_index(index).hnsw.efSearch}
+    return {}
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    '''
+    Sets nprobe (inverted lists visited, IVF) and efSearch (candidate list size, HNSW);
+    parameters that do not apply to the index are ignored.
+    '''
+    kind = index_kind(index)
+    if nprobe and kind.startswith("IVF"):
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    if ef_search and kind == "HNSW":
+        faiss.downcast_index(index).hnsw.efSearch = ef_search
+
+
+def search_parameters(index: faiss.Index, nprobe: Optional[int] = None,
+                      ef_search: Optional[int] = None) -> Optional[faiss.SearchParameters]:
+    '''Per-call SearchParametersIVF / SearchParametersHNSW for nprobe / efSearch, or None if neither applies.'''
+    kind = index_kind(index)
+    if nprobe and kind.startswith("IVF"):
+        return faiss.SearchParametersIVF(nprobe=min(nprobe, faiss.extract_index_ivf(index).nlist))
+    if ef_search and kind == "HNSW":
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+
+class SearchView:
+    '''
+    An index whose search() passes fixed per-call search parameters, while every other attribute is the
+    shared index's. Threads that search one index with different nprobe / efSearch then cannot change
+    each other's settings, which set_search_params on the shared index would.
+    '''
+
+    def __init__(self, index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        self.index = index
+        self.params = search_parameters(index, nprobe, ef_search)
+
+    def search(self, x: np.ndarray, k: int, **kwargs):
+        return self.index.search(x, k, params=self.params, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+
+def recall_report(index: faiss.Index, vectors: np.ndarray, k: int = 10, n_queries: int = 200,
+                  nprobes=(1, 4, 16, 64), ef_searches=(16, 32, 64, 128), seed: int = 0) -> List[dict]:
+    '''
+    Recall@k and per-query latency of index for each nprobe / efSearch setting, next to exact search.
+    vectors must be the indexed vectors in index order (id i is vectors[i]); a random sample of them
+    is used as queries. Each setting is passed per search call, so the index itself is left unchanged.
+    '''
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)]
+    k = min(k, len(vectors))
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    start = timer()
+    _, truth = exact.search(queries, k)
+    rows = [{"index": "Flat (exact)", "params": "", f"recall@{k}": 1.0,
+             "latency_ms": (timer() - start) * 1e3 / len(queries)}]
+
+    kind = index_kind(index)
+    if kind.startswith("IVF"):
+        settings = [{"nprobe": p} for p in nprobes if p <= get_search_params(index)["nlist"]]
+    elif kind == "HNSW":
+        settings = [{"ef_search": ef} for ef in ef_searches]
+    else:
+        settings = [{}]
+    for params in settings:
+        search_params = search_parameters(index, **params)
+        start = timer()
+        _, found = index.search(queries, k, params=search_params)
+        latency = (timer() - start) * 1e3 / len(queries)
+        recall = np.mean([len(np.intersect1d(f, t)) / k for f, t in zip(found, truth)])
+        rows.append({"index": kind, "params": ", ".join(f"{name}={value}" for name, value in params.items()),
+                     f"recall@{k}": float(recall), "latency_ms": latency})
+    return rows
+
+
+INDEX_FILE = "index.faiss"
+IDS_FILE = "ids.npy"
+CHUNKS_FILE = "chunks.bin"
+OFFSETS_FILE = "offsets.npy"
+CURRENT_FILE = "CURRENT"
+
+
+def read_index(path: str, use_mmap: bool = True) -> faiss.Index:
+    '''
+    Memory-maps the index read-only, or reads it into memory when use_mmap is False or the index
+    type cannot be mapped. IO_FLAG_MMAP_IFC maps the flat / scalar-quantized code arrays as well as
+    IVF lists (plain IO_FLAG_MMAP only maps IVF lists), so the vectors stay in the shared page cache;
+    only HNSW's neighbour graph is still read onto the heap.
+    A mapped index is searchable but cannot be added to.
+    '''
+    if use_mmap:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path)
+
+
+def store_version(directory: str) -> Optional[str]:
+    '''Name of the live generation, or None for a store saved before generations were used.'''
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), encoding="utf-8") as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def generation_path(directory: str, version: Optional[str] = None) -> str:
+    '''Directory holding the files of a generation (the live one by default).'''
+    version = version or store_version(directory)
+    return os.path.join(directory, version) if version else directory
+
+
+def write_store(directory: str, index: faiss.Index, ids: List[str],
+                documents: Iterable[Tuple[str, dict]]) -> str:
+    '''
+    Saves an index with its chunk ids and (text, metadata) records, all in index order, as a new
+    generation and makes it the live one; returns its name. Each record is one JSON line of metadata
+    followed by the UTF-8 text. The previous generation is kept for readers that are still opening it,
+    older ones are removed.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    version = str(time.time_ns())
+    path = os.path.join(directory, version)
+    os.makedirs(path)
+    offsets = [0]
+    with open(os.path.join(path, CHUNKS_FILE), "wb") as file:
+        for text, metadata in documents:
+            file.write(json.dumps(metadata, ensure_ascii=False).encode("utf-8") + b"\n" + text.encode("utf-8"))
+            offsets.append(file.tell())
+    if len(offsets) != len(ids) + 1:
+        shutil.rmtree(path)
+        raise ValueError(f"{len(ids)} ids but {len(offsets) - 1} documents")
+    np.save(os.path.join(path, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+    np.save(os.path.join(path, IDS_FILE), np.asarray(ids, dtype=np.bytes_))
+    faiss.write_index(index, os.path.join(path, INDEX_FILE))
+
+    previous = store_version(directory)
+    current = os.path.join(directory, CURRENT_FILE)
+    with open(current + ".tmp", "w", encoding="utf-8") as file:
+        file.write(version)
+    os.replace(current + ".tmp", current)
+    for name in os.listdir(directory):
+        if name not in (version, previous) and name.isdigit() and os.path.isdir(os.path.join(directory, name)):
+            # files still mapped by another process cannot be removed on Windows; a later save retries
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return version
+
+
+def store_exists(directory: str) -> bool:
+    path = generation_path(directory)
+    return all(os.path.exists(os.path.join(path, name)) for name in (INDEX_FILE, IDS_FILE, CHUNKS_FILE, OFFSETS_FILE))
+
+
+class MmapDocstore(Docstore):
+    '''Read-only docstore over the chunks.bin of one generation; search() takes the index position of a chunk.'''
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(path, CHUNKS_FILE), "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def ids(self) -> np.ndarray:
+        '''Chunk ids of the same generation in index order, memory-mapped (bytes; decode an element with .decode()).'''
+        return np.load(os.path.join(self.path, IDS_FILE), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def search(self, search: Union[int, str]) -> Union[str, Document]:
+        if not isinstance(search, (int, np.integer)) or not 0 <= search < len(self):
+            return f"ID {search} not found."
+        record = self._data[int(self.offsets[search]):int(self.offsets[search + 1])]
+        metadata, _, text = record.partition(b"\n")
+        return Document(page_content=text.decode("utf-8"), metadata=json.loads(metadata))
+
+
+class PositionMap(Mapping):
+    '''index_to_docstore_id for MmapDocstore: maps each index position to itself without a dict.'''
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def __getitem__(self, position: int) -> int:
+        if not 0 <= position < self.size:
+            raise KeyError(position)
+        return position
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def load_store(directory: str, use_mmap: bool = True) -> Tuple[faiss.Index, MmapDocstore, PositionMap]:
+    '''
+    (index, docstore, index_to_docstore_id) for a read-only langchain FAISS vector store. CURRENT is read
+    once, so all parts come from the same generation.
+    '''
+    path = generation_path(directory)
+    docstore = MmapDocstore(path)
+    return read_index(os.path.join(path, INDEX_FILE), use_mmap), docstore, PositionMap(len(docstore))
@@ -3,99 +3,358 @@ example code for learning Retrieval-Augmented Generation (RAG) with ChromaDB and
 pip install -U sentence-transformers
 """
 
-from typing import List
+import asyncio
+import hashlib
+import json
+import os
+import time
+from functools import lru_cache
+from collections import OrderedDict
+from typing import List, Tuple
+import numpy as np
 from sentence_transformers import SentenceTransformer
 import chromadb
 from sentence_transformers import CrossEncoder
 from dotenv import load_dotenv
 from google import genai
+from embedding_cache import EmbeddingCache, cached_encode, text_hash
+from bm25_index import BM25Index
+from chunking import Chunker, chunk_files, read_pages
 
 
+# Chunks are paragraph/sentence aligned and sized for the embedding model's short context;
+# no overlap, so every character is embedded exactly once.
+CHUNK_SIZE = 256
+chunker = Chunker(chunk_size=CHUNK_SIZE)
+
 def split_into_chunks(doc_file: str) -> List[str]:
-    '''Splits the content of a doc file into chunks based on paragraphs.'''
-    with open(doc_file, 'r', encoding='UTF-8') as file:
-        content = file.read()
+    '''Splits a doc file into heading / paragraph aligned chunks of at most CHUNK_SIZE characters.'''
+    return [chunk.text for chunk in chunker.chunk_pages(read_pages(doc_file))]
+
+# The embedding model is loaded lazily: when every text hits the embedding cache
+# (e.g. a repeated query against an unchanged store) it is never loaded at all.
+EMBEDDING_MODEL_NAME = "shibing624/text2vec-base-chinese"
+embedding_cache = EmbeddingCache("embedding_cache.sqlite")
+
+@lru_cache(maxsize=None)
+def get_embedding_model() -> SentenceTransformer:
+    '''Loads the embedding model on first use.'''
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
 
-    return [chunk for chunk in content.split("\n\n")]
+def encode_batched(texts: List[str], batch_size: int = 64, num_workers: int = 0) -> np.ndarray:
+    '''Encodes texts in batches of batch_size, fanning out over num_workers CPU processes if > 1.'''
+    embedding_model = get_embedding_model()
+    if num_workers > 1:
+        pool = embedding_model.start_multi_process_pool(target_devices=["cpu"] * num_workers)
+        try:
+            embeddings = embedding_model.encode_multi_process(
+                texts, pool, batch_size=batch_size, normalize_embeddings=True
+            )
+        finally:
+            embedding_model.stop_multi_process_pool(pool)
+    else:
+        embeddings = embedding_model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+def embed_chunks(chunks: List[str], batch_size: int = 64, num_workers: int = 0) -> np.ndarray:
+    '''
+    Embeds many chunks at once and returns a contiguous float32 matrix of shape (len(chunks), dim).
+    Only chunks missing from the embedding cache are sent to the model.
+    '''
+    return cached_encode(
+        embedding_cache, EMBEDDING_MODEL_NAME, chunks,
+        lambda texts: encode_batched(texts, batch_size, num_workers)
+    )
 
-# Initialize the embedding model
-embedding_model = SentenceTransformer("shibing624/text2vec-base-chinese")
 def embed_chunk(chunk: str) -> List[float]:
-    '''Embeds a chunk of text using the specified embedding model.'''
-    embedding = embedding_model.encode(chunk, normalize_embeddings=True)
-    return embedding.tolist()
+    '''Embeds a chunk of text using the specified embedding model, reusing cached vectors.'''
+    return embed_chunks([chunk])[0].tolist()
 
-# Initialize ChromaDB client and collection
-chromadb_client = chromadb.EphemeralClient()
+# Initialize a persistent ChromaDB client and collection
+CHROMA_PATH = "chroma_db"
+MANIFEST_FILE = os.path.join(CHROMA_PATH, "manifest.json")
+BM25_FILE = os.path.join(CHROMA_PATH, "bm25.npz")
+chromadb_client = chromadb.PersistentClient(path=CHROMA_PATH)
 chromadb_collection = chromadb_client.get_or_create_collection(name="default")
 
-def save_embeddings(chunks: List[str], embeddings: List[List[float]]) -> None:
-    '''Saves the chunks and their embeddings to the ChromaDB collection.'''
-    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-        chromadb_collection.add(
-            documents=[chunk],
-            embeddings=[embedding],
-            ids=[str(i)]
+def chunk_id(chunk: str, source: str = "") -> str:
+    '''Returns a stable content-derived id, so re-running the ingest upserts instead of colliding.'''
+    return hashlib.sha1(f"{source}\0{chunk}".encode("utf-8")).hexdigest()
+
+def save_embeddings(chunks: List[str], embeddings: np.ndarray, batch_size: int | None = None,
+                    source: str = "") -> int:
+    '''
+    Upserts the chunks and their embeddings into the ChromaDB collection in large batches.
+    Duplicate chunks are written once. Returns the number of chunks written and prints docs/sec.
+    '''
+    batch_size = batch_size or chromadb_client.get_max_batch_size()
+    unique = {}
+    for chunk, embedding in zip(chunks, embeddings):
+        unique.setdefault(chunk_id(chunk, source), (chunk, embedding))
+    ids = list(unique)
+
+    start_time = time.perf_counter()
+    for i in range(0, len(ids), batch_size):
+        batch_ids = ids[i:i + batch_size]
+        chromadb_collection.upsert(
+            ids=batch_ids,
+            documents=[unique[id_][0] for id_ in batch_ids],
+            embeddings=np.stack([unique[id_][1] for id_ in batch_ids]),
+            metadatas=[{"source": source}] * len(batch_ids)
         )
+    elapsed = time.perf_counter() - start_time
+    print(f"Upserted {len(ids)} chunks in {elapsed:.2f}s ({len(ids) / max(elapsed, 1e-9):.0f} docs/sec)")
+    return len(ids)
+
+def load_manifest() -> dict:
+    '''Returns {file: {"mtime", "size", "sha1"}} for every file already in the store.'''
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE, 'r', encoding='UTF-8') as file:
+        return json.load(file)
+
+def save_manifest(manifest: dict) -> None:
+    with open(MANIFEST_FILE, 'w', encoding='UTF-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+
+def sync_documents(doc_files: List[str]) -> int:
+    '''
+    Brings the persistent store up to date with doc_files and returns the number of re-processed or removed files.
+    Files whose mtime and size match the manifest are skipped without reading them; files that were
+    touched but whose content hash is unchanged only refresh the manifest. Changed files are chunked
+    in parallel, one process per document. Files that are no longer in doc_files or no longer exist
+    are removed from the store and the manifest.
+    '''
+    manifest = load_manifest()
+    present = [doc_file for doc_file in doc_files if os.path.exists(doc_file)]
+    removed = [doc_file for doc_file in manifest if doc_file not in present]
+    for doc_file in removed:
+        chromadb_collection.delete(where={"source": doc_file})
+        del manifest[doc_file]
+
+    changed = []
+    for doc_file in present:
+        stat = os.stat(doc_file)
+        entry = manifest.get(doc_file)
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            continue
+        with open(doc_file, 'rb') as file:
+            digest = hashlib.sha1(file.read()).hexdigest()
+        if not entry or entry["sha1"] != digest:
+            changed.append(doc_file)
+        manifest[doc_file] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha1": digest}
+
+    chunks, stats = chunk_files(changed, chunker)
+    texts_by_source = {doc_file: [] for doc_file in changed}
+    for chunk in chunks:
+        texts_by_source[chunk.source].append(chunk.text)
+    for doc_file, texts in texts_by_source.items():
+        chromadb_collection.delete(where={"source": doc_file})
+        if texts:
+            save_embeddings(texts, embed_chunks(texts), source=doc_file)
+    if changed:
+        print(f"Chunked {len(changed)} files into {stats.chunks} chunks (amplification {stats.amplification:.2f})")
+    save_manifest(manifest)
+    if changed or removed or not os.path.exists(BM25_FILE):
+        build_bm25_index()
+    return len(changed) + len(removed)
+
+def build_bm25_index() -> BM25Index:
+    '''Rebuilds the keyword index over everything in the collection and saves it next to the store.'''
+    stored = chromadb_collection.get(include=["documents"])
+    index = BM25Index().build(stored["ids"], stored["documents"])
+    index.save(BM25_FILE)
+    get_bm25_index.cache_clear()
+    return index
+
+@lru_cache(maxsize=None)
+def get_bm25_index() -> BM25Index:
+    return BM25Index.load(BM25_FILE)
 
 def retrieve(query: str, top_k: int) -> List[str]:
     '''Retrieves the top_k chunks that are most similar to the query.'''
-    query_embedding = embed_chunk(query)
+    return retrieve_many([query], top_k)[0]
+
+def retrieve_many(queries: List[str], top_k: int) -> List[List[str]]:
+    '''Embeds all queries in one batch and runs them as a single multi-query vector search.'''
+    return retrieve_many_with_distances(queries, top_k)[0]
+
+def retrieve_many_with_distances(queries: List[str], top_k: int) -> Tuple[List[List[str]], List[List[float]]]:
+    '''Like retrieve_many, but also returns the first-stage distances (smaller is closer).'''
     results = chromadb_collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k
+        query_embeddings=embed_chunks(queries),
+        n_results=top_k,
+        include=["documents", "distances"]
+    )
+    return results['documents'], results['distances']
+
+def hybrid_retrieve(query: str, top_k: int, candidates: int = 20) -> List[str]:
+    '''Retrieves the top_k chunks by fusing BM25 keyword and dense vector rankings.'''
+    return hybrid_retrieve_many([query], top_k, candidates)[0]
+
+def hybrid_retrieve_many(queries: List[str], top_k: int, candidates: int = 20,
+                         rrf_k: int = 60) -> List[List[str]]:
+    '''
+    Hybrid retrieval for many queries: `candidates` hits from one multi-query vector search and
+    from the BM25 index are fused with reciprocal rank fusion (sum of 1 / (rrf_k + rank)), so exact
+    term matches such as names or part numbers surface without over-fetching dense results.
+    '''
+    dense = chromadb_collection.query(
+        query_embeddings=embed_chunks(queries),
+        n_results=candidates,
+        include=["documents"]
     )
-    return results['documents'][0]
+    bm25 = get_bm25_index()
+    texts = {}
+    fused_ids = []
+    for query, dense_ids, dense_docs in zip(queries, dense["ids"], dense["documents"]):
+        texts.update(zip(dense_ids, dense_docs))
+        keyword_ids, _ = bm25.search(query, candidates)
+        fused = {}
+        for ranking in (dense_ids, keyword_ids):
+            for rank, id_ in enumerate(ranking):
+                fused[id_] = fused.get(id_, 0.0) + 1.0 / (rrf_k + rank + 1)
+        fused_ids.append(sorted(fused, key=fused.get, reverse=True)[:top_k])
+
+    missing = list({id_ for ids in fused_ids for id_ in ids if id_ not in texts})
+    if missing:
+        stored = chromadb_collection.get(ids=missing, include=["documents"])
+        texts.update(zip(stored["ids"], stored["documents"]))
+    return [[texts[id_] for id_ in ids] for ids in fused_ids]
+
+# Initialize the cross-encoder for reranking on first use
+@lru_cache(maxsize=None)
+def get_cross_encoder() -> CrossEncoder:
+    return CrossEncoder('cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
 
-# Initialize the cross-encoder for reranking
-cross_encoder = CrossEncoder('cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
 def rerank(query: str, retrieved_chunks: List[str], top_k: int) -> List[str]:
     '''Reranks the retrieved chunks based on their relevance to the query using a cross-encoder.'''
-    pairs = [(query, chunk) for chunk in retrieved_chunks]
-    scores = cross_encoder.predict(pairs)
+    return rerank_many([query], [retrieved_chunks], top_k)[0]
+
+# Cross-encoder scores keyed by (query hash, chunk hash), evicted least recently used first
+RERANK_CACHE_SIZE = 100_000
+rerank_cache: OrderedDict = OrderedDict()
 
-    scored_chunks = list(zip(retrieved_chunks, scores))
-    scored_chunks.sort(key=lambda x: x[1], reverse=True)
+def score_pairs(pairs: List[Tuple[str, str]], batch_size: int = 64) -> np.ndarray:
+    '''Returns cross-encoder scores for the pairs, predicting only pairs missing from rerank_cache.'''
+    keys = [(text_hash(query), text_hash(chunk)) for query, chunk in pairs]
+    missing = list(dict.fromkeys(
+        (key, pair) for key, pair in zip(keys, pairs) if key not in rerank_cache
+    ))
+    if missing:
+        predicted = get_cross_encoder().predict([pair for _, pair in missing], batch_size=batch_size)
+        for (key, _), score in zip(missing, predicted):
+            rerank_cache[key] = float(score)
+    scores = np.empty(len(keys), dtype=np.float32)
+    for i, key in enumerate(keys):
+        rerank_cache.move_to_end(key)
+        scores[i] = rerank_cache[key]
+    while len(rerank_cache) > RERANK_CACHE_SIZE:
+        rerank_cache.popitem(last=False)
+    return scores
 
-    return [chunk for chunk, _ in scored_chunks][:top_k]
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    '''Indices of the top_k highest scores, best first, without sorting the whole array.'''
+    if top_k < len(scores):
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+def rerank_many(queries: List[str], chunk_lists: List[List[str]], top_k: int,
+                distances: List[List[float]] | None = None, margin: float | None = None,
+                batch_size: int = 64) -> List[List[str]]:
+    '''
+    Reranks the chunks of many queries, scoring all their uncached (query, chunk) pairs in one
+    batched cross-encoder call. When first-stage distances and a margin are given, a query whose
+    top_k-th and (top_k+1)-th distances differ by at least margin keeps its first-stage top_k
+    without being reranked.
+    '''
+    decisive = [
+        distances is not None and margin is not None and len(chunks) > top_k
+        and distances[i][top_k] - distances[i][top_k - 1] >= margin
+        for i, chunks in enumerate(chunk_lists)
+    ]
+    pairs = [
+        (query, chunk)
+        for query, chunks, skip in zip(queries, chunk_lists, decisive) if not skip
+        for chunk in chunks
+    ]
+    scores = score_pairs(pairs, batch_size) if pairs else np.empty(0, dtype=np.float32)
+
+    reranked, offset = [], 0
+    for chunks, skip in zip(chunk_lists, decisive):
+        if skip:
+            reranked.append(chunks[:top_k])
+            continue
+        order = top_k_indices(scores[offset:offset + len(chunks)], top_k)
+        reranked.append([chunks[i] for i in order])
+        offset += len(chunks)
+    return reranked
 
 
 load_dotenv()
 google_client = genai.Client()
+GENERATION_MODEL = "gemini-2.5-flash"
 
-def generate(query: str, chunks: List[str]) -> str:
-    '''Generates an answer to the query based on the provided chunks using Google GenAI.'''
-    prompt = f"""你是一位知识助手，请根据用户的问题和下列片段生成准确的回答。
+def build_prompt(query: str, chunks: List[str]) -> str:
+    return f"""你是一位知识助手，请根据用户的问题和下列片段生成准确的回答。
     用户问题: {query}
     相关片段:
     {"\n\n".join(chunks)}
     请基于上述内容作答，不要编造信息。"""
 
+def generate(query: str, chunks: List[str]) -> str:
+    '''Generates an answer to the query based on the provided chunks using Google GenAI.'''
+    prompt = build_prompt(query, chunks)
+
     print(f"{prompt}\n\n---\n")
 
     response = google_client.models.generate_content(
-        model="gemini-2.5-flash",
+        model=GENERATION_MODEL,
         contents=prompt
     )
 
     return response.text
 
+async def generate_many(queries: List[str], chunk_lists: List[List[str]], concurrency: int = 8) -> List[str]:
+    '''Issues the generation calls concurrently, with at most `concurrency` requests in flight.'''
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate_one(query: str, chunks: List[str]) -> str:
+        async with semaphore:
+            response = await google_client.aio.models.generate_content(
+                model=GENERATION_MODEL,
+                contents=build_prompt(query, chunks)
+            )
+            return response.text
+
+    return await asyncio.gather(*(generate_one(q, c) for q, c in zip(queries, chunk_lists)))
+
+def answer_queries(queries: List[str], retrieve_k: int = 5, rerank_k: int = 3,
+                   concurrency: int = 8, rerank_margin: float | None = None,
+                   hybrid: bool = False) -> List[str]:
+    '''
+    Batch RAG over many questions: one batched embedding + multi-query search (hybrid BM25 +
+    vector if requested), one batched rerank, then concurrent generation.
+    Answers are returned in input order.
+    '''
+    if hybrid:
+        retrieved, distances = hybrid_retrieve_many(queries, retrieve_k), None
+    else:
+        retrieved, distances = retrieve_many_with_distances(queries, retrieve_k)
+    reranked = rerank_many(queries, retrieved, rerank_k, distances, rerank_margin)
+    return asyncio.run(generate_many(queries, reranked, concurrency))
+
 def main():
     '''Main function to run the RAG process.'''
-    # 拆分文档
-    chunks = split_into_chunks("doc.md")
-    for i, chunk in enumerate(chunks):
-        print(f"[{i}] {chunk}\n")
-    # 生成嵌入
-    embeddings = [embed_chunk(chunk) for chunk in chunks]
-    print(len(embeddings))
-    print(embeddings)
-    # 保存嵌入到ChromaDB
-    save_embeddings(chunks, embeddings)
+    # 同步文档到持久化的ChromaDB，只有新增或修改过的文件才会重新拆分和嵌入
+    processed = sync_documents(["doc.md"])
+    print(f"re-processed {processed} file(s), {chromadb_collection.count()} chunks in store")
 
     query = "哆啦A梦使用的3个秘密道具分别是什么？"
-    # 检索与query相关片段
-    retrieved_chunks = retrieve(query, 5)
+    # 混合检索（BM25关键词 + 向量）与query相关片段
+    retrieved_chunks = hybrid_retrieve(query, 5)
     for i, chunk in enumerate(retrieved_chunks):
         print(f"[{i}] {chunk}\n")
     # 重新排序片段
@@ -105,6 +364,7 @@ def main():
     # 调用LLM参考文档片段基于query生成回答
     answer = generate(query, reranked_chunks)
     print(answer)
+    print(f"embedding cache: {embedding_cache.stats()}")
 
 if __name__ == "__main__":
     main()
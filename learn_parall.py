@@ -1,28 +1,249 @@
+import asyncio
+import inspect
+import os
+import sys
 import threading
+from collections import deque
+from dataclasses import dataclass
 from multiprocessing import Process as mp
-from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import timeit
+import numpy as np
 
-def print_fib(n):
-    """Prints the Fibonacci sequence up to the nth number."""
-    def fib(n):
-        """Returns the nth Fibonacci number."""
-        if n <= 0:
-            return 0
-        elif n == 1:
-            return 1
+def fib_iterative(n):
+    """Returns the nth Fibonacci number in O(n) big-integer additions."""
+    a, b = 0, 1
+    for _ in range(max(n, 0)):
+        a, b = b, a + b
+    return a
+
+def fib_fast_doubling(n):
+    """Returns the nth Fibonacci number in O(log n) steps using
+    F(2k) = F(k) * (2F(k+1) - F(k)) and F(2k+1) = F(k)^2 + F(k+1)^2."""
+    a, b = 0, 1  # F(k), F(k+1) for k = the bits of n read so far
+    for bit in bin(max(n, 0))[2:]:
+        a, b = a * (2 * b - a), a * a + b * b
+        if bit == "1":
+            a, b = b, a + b
+    return a
+
+FIB_METHODS = {"iterative": fib_iterative, "doubling": fib_fast_doubling}
+
+def fib(n, method="doubling"):
+    """Returns the nth Fibonacci number with the chosen method."""
+    return FIB_METHODS[method](n)
+
+def _fib_chunk(ns, method):
+    """Worker: computes one chunk of inputs inside a pool process."""
+    return [FIB_METHODS[method](n) for n in ns]
+
+def fib_batch(ns, method="doubling", max_workers=None, chunksize=None):
+    """
+    Computes fib(n) for every n in ns on a ProcessPoolExecutor and returns the results in order.
+    Inputs are sent in chunks (by default about four per worker) to amortize pickling and IPC.
+    """
+    ns = list(ns)
+    if not ns:
+        return []
+    max_workers = max_workers or os.cpu_count() or 1
+    chunksize = chunksize or max(1, -(-len(ns) // (max_workers * 4)))
+    chunks = [ns[i:i + chunksize] for i in range(0, len(ns), chunksize)]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        results = pool.map(_fib_chunk, chunks, [method] * len(chunks))
+        return [value for chunk in results for value in chunk]
+
+@dataclass
+class MapStats:
+    """Timing of one ParallelExecutor.map run."""
+    backend: str
+    max_workers: int
+    items: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self):
+        return self.items / self.elapsed if self.elapsed else 0.0
+
+class ParallelExecutor:
+    """
+    One map-style API over threads, processes or an asyncio loop.
+    map() yields results in input order while keeping at most max_pending calls in flight,
+    so large (or endless) iterables are consumed lazily instead of being submitted all at once.
+    """
+    BACKENDS = ("thread", "process", "async")
+
+    def __init__(self, backend="thread", max_workers=None, max_pending=None):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"backend must be one of {self.BACKENDS}")
+        self.backend = backend
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 4
+        self.stats = None
+
+    def map(self, func, iterable):
+        """Runs func over iterable; for the async backend func may be a coroutine function."""
+        self.stats = MapStats(self.backend, self.max_workers)
+        start_time = timeit.default_timer()
+        if self.backend == "async":
+            results = self._map_async(func, iterable)
         else:
-            return fib(n - 1) + fib(n - 2)
-    
-    print(f"Fibonacci number {n}: {fib(n)}")  # Print the nth Fibonacci number
+            results = self._map_pool(func, iterable)
+        for result in results:
+            self.stats.items += 1
+            yield result
+        self.stats.elapsed = timeit.default_timer() - start_time
+
+    def _map_pool(self, func, iterable):
+        pool_class = ThreadPoolExecutor if self.backend == "thread" else ProcessPoolExecutor
+        with pool_class(max_workers=self.max_workers) as pool:
+            pending = deque()
+            for item in iterable:
+                pending.append(pool.submit(func, item))
+                if len(pending) >= self.max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _map_async(self, func, iterable):
+        loop = asyncio.new_event_loop()
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def call(item):
+            async with semaphore:
+                if inspect.iscoroutinefunction(func):
+                    return await func(item)
+                return await asyncio.to_thread(func, item)
+
+        try:
+            pending = deque()
+            for item in iterable:
+                pending.append(loop.create_task(call(item)))
+                if len(pending) >= self.max_pending:
+                    yield loop.run_until_complete(pending.popleft())
+            while pending:
+                yield loop.run_until_complete(pending.popleft())
+        finally:
+            for task in pending:
+                task.cancel()
+            # let cancelled tasks run their cleanup before the loop closes
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+
+def parallel_map(func, iterable, backend="thread", max_workers=None, max_pending=None):
+    """Returns (results, MapStats) for func over iterable on the chosen backend."""
+    executor = ParallelExecutor(backend, max_workers, max_pending)
+    results = list(executor.map(func, iterable))
+    return results, executor.stats
+
+def compare_backends(func, inputs, backends=ParallelExecutor.BACKENDS, max_workers=None):
+    """Runs the same workload on every backend, prints a timing table and returns the stats."""
+    inputs = list(inputs)
+    all_stats = []
+    for backend in backends:
+        _, stats = parallel_map(func, inputs, backend, max_workers)
+        print(f"{backend:<8} {stats.items} items in {stats.elapsed:.4f} seconds "
+              f"({stats.throughput:.1f} items/s, {stats.max_workers} workers)")
+        all_stats.append(stats)
+    return all_stats
+
+@dataclass(frozen=True)
+class SharedArraySpec:
+    """Picklable handle of a SharedArray: what a worker needs to attach to it."""
+    name: str
+    shape: tuple
+    dtype: str
+
+class SharedArray:
+    """
+    A NumPy array living in a multiprocessing.shared_memory block.
+    The creating process owns the block and unlinks it on close(); workers attach() by spec and
+    read or write the same memory without pickling the data. Use as a context manager.
+    """
+    def __init__(self, shm, shape, dtype, owner):
+        self.shm = shm
+        self.owner = owner
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        self.spec = SharedArraySpec(shm.name, tuple(shape), np.dtype(dtype).str)
+
+    @classmethod
+    def create(cls, shape, dtype=np.float32):
+        nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        return cls(SharedMemory(create=True, size=nbytes), shape, dtype, owner=True)
+
+    @classmethod
+    def from_array(cls, array):
+        """Copies array into a new shared block (the only copy made)."""
+        shared = cls.create(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
 
-def test_threadings():
-    n = 10  # Number of Fibonacci numbers to print
+    @classmethod
+    def attach(cls, spec):
+        """
+        Maps an existing block; the attaching process never unlinks it.
+        Before Python 3.13 attaching also registers the block with the resource tracker; pool
+        workers share their parent's tracker, so that registration is a no-op for them.
+        """
+        if sys.version_info >= (3, 13):
+            shm = SharedMemory(name=spec.name, track=False)
+        else:
+            shm = SharedMemory(name=spec.name)
+        return cls(shm, spec.shape, spec.dtype, owner=False)
+
+    def close(self):
+        self.array = None  # drop the view before closing the buffer
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _shared_chunk(func, input_spec, output_spec, start, stop):
+    """Worker: attaches both arrays and lets func fill output rows [start, stop)."""
+    with SharedArray.attach(input_spec) as inputs, SharedArray.attach(output_spec) as outputs:
+        func(inputs.array[start:stop], outputs.array[start:stop])
+    return stop - start
+
+def shared_array_map(func, inputs, output_shape, output_dtype=np.float32, max_workers=None, chunks=None):
+    """
+    Applies func(input_rows, output_rows) to row blocks of inputs on a process pool.
+    Inputs and outputs are passed through shared memory, so only small specs are pickled;
+    func must be a module-level function that writes its result into output_rows in place.
+    Returns a regular array holding the output.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    chunks = chunks or max_workers * 4
+    bounds = np.linspace(0, len(inputs), min(chunks, max(len(inputs), 1)) + 1, dtype=int)
+    with SharedArray.from_array(np.asarray(inputs)) as shared_inputs, \
+            SharedArray.create(output_shape, output_dtype) as shared_outputs:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(_shared_chunk, func, shared_inputs.spec, shared_outputs.spec, int(start), int(stop))
+                for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+            ]
+            for future in futures:
+                future.result()
+        return shared_outputs.array.copy()
+
+def print_fib(n, method="iterative"):
+    """Prints the nth Fibonacci number. The O(n) iterative method is the default CPU-bound workload."""
+    value = fib(n, method)
+    text = str(value) if value.bit_length() < 10_000 else f"<{value.bit_length()} bits>"
+    print(f"Fibonacci number {n}: {text}")  # Print the nth Fibonacci number
+
+def test_threadings(n1=100_000, n2=110_000):
+    """Runs print_fib(n1) and print_fib(n2) on two threads and returns the elapsed time."""
     start_time = timeit.default_timer()  # Start timing
 
     # Create a thread to run the Fibonacci function
-    fib_thread_1 = threading.Thread(target=print_fib, args=(40,))
-    fib_thread_2 = threading.Thread(target=print_fib, args=(41,))
+    fib_thread_1 = threading.Thread(target=print_fib, args=(n1,))
+    fib_thread_2 = threading.Thread(target=print_fib, args=(n2,))
 
     fib_thread_1.start()  # Start the thread
     fib_thread_2.start()  # Start the second thread
@@ -32,15 +253,15 @@ def test_threadings():
 
     elapsed_time = timeit.default_timer() - start_time  # Calculate elapsed time
     print(f"Elapsed time: {elapsed_time:.4f} seconds")  # Print elapsed time
+    return elapsed_time
 
-def test_processings():
-    """Test function to demonstrate multiprocessing."""
-    n = 10  # Number of Fibonacci numbers to print
+def test_processings(n1=100_000, n2=110_000):
+    """Test function to demonstrate multiprocessing. Returns the elapsed time."""
     start_time = timeit.default_timer()  # Start timing
 
     # Create a process to run the Fibonacci function
-    fib_process_1 = mp(target=print_fib, args=(40,))
-    fib_process_2 = mp(target=print_fib, args=(41,))
+    fib_process_1 = mp(target=print_fib, args=(n1,))
+    fib_process_2 = mp(target=print_fib, args=(n2,))
 
     fib_process_1.start()  # Start the process
     fib_process_2.start()  # Start the second process
@@ -50,6 +271,49 @@ def test_processings():
 
     elapsed_time = timeit.default_timer() - start_time  # Calculate elapsed time
     print(f"Elapsed time: {elapsed_time:.4f} seconds")  # Print elapsed time
+    return elapsed_time
+
+
+def test_fib_batch(ns=tuple(range(50_000, 82_000, 1_000)), max_workers=None):
+    """Compares a serial loop with fib_batch on a process pool and returns both elapsed times."""
+    start_time = timeit.default_timer()
+    serial = [fib_iterative(n) for n in ns]
+    serial_time = timeit.default_timer() - start_time
+
+    start_time = timeit.default_timer()
+    parallel = fib_batch(ns, method="iterative", max_workers=max_workers)
+    parallel_time = timeit.default_timer() - start_time
+
+    assert parallel == serial
+    print(f"Serial: {serial_time:.4f} seconds, pool: {parallel_time:.4f} seconds "
+          f"(speedup x{serial_time / parallel_time:.2f} on {max_workers or os.cpu_count()} workers)")
+    return serial_time, parallel_time
+
+
+def _normalize_rows(rows, out):
+    """Example shared-memory workload: L2-normalize embedding rows."""
+    np.divide(rows, np.linalg.norm(rows, axis=1, keepdims=True), out=out)
+
+def _normalize_rows_pickled(rows):
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+def test_shared_memory(rows=200_000, dim=384, max_workers=None):
+    """Compares pickling row blocks through a process pool with shared_array_map."""
+    matrix = np.random.default_rng(0).random((rows, dim), dtype=np.float32)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    start_time = timeit.default_timer()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        pickled = np.vstack(list(pool.map(_normalize_rows_pickled, np.array_split(matrix, max_workers * 4))))
+    pickled_time = timeit.default_timer() - start_time
+
+    start_time = timeit.default_timer()
+    shared = shared_array_map(_normalize_rows, matrix, matrix.shape, matrix.dtype, max_workers)
+    shared_time = timeit.default_timer() - start_time
+
+    assert np.allclose(pickled, shared)
+    print(f"Pickled: {pickled_time:.4f} seconds, shared memory: {shared_time:.4f} seconds")
+    return pickled_time, shared_time
 
 
 def main():
@@ -57,6 +321,9 @@ def main():
     print("Starting threading test...")  # Indicate start of the test
     test_processings()  # Run the threading test
     print("Threading test completed.")  # Indicate completion of the test
+    test_fib_batch()
+    compare_backends(fib_iterative, range(50_000, 66_000, 1_000))
+    test_shared_memory()
 
 
 if __name__ == "__main__":
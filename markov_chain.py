@@ -1,21 +1,110 @@
 import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
 class MarkovChain:
-    def __init__(self, transition_matrix):
+    def __init__(self, transition_matrix, seed=None):
         """
         Initialize the Markov Chain with a transition matrix.
-        :param transition_matrix: A square numpy array representing the transition probabilities.
+        :param transition_matrix: A square numpy array, or a scipy.sparse matrix (stored as CSR),
+            representing the transition probabilities.
+        :param seed: Seed (or np.random.Generator) for the chain's random number generator.
         """
-        self.transition_matrix = np.array(transition_matrix)
+        self.is_sparse = sp.issparse(transition_matrix)
+        if self.is_sparse:
+            self.transition_matrix = sp.csr_matrix(transition_matrix, dtype=np.float64, copy=True)
+            self.transition_matrix.eliminate_zeros()
+            self.transition_matrix.sort_indices()
+            if np.any(np.diff(self.transition_matrix.indptr) == 0):
+                raise ValueError("every row of a sparse transition matrix needs at least one transition")
+        else:
+            self.transition_matrix = np.array(transition_matrix)
         self.state_count = self.transition_matrix.shape[0]
-    
+        self.rng = np.random.default_rng(seed)
+        self._flat_cdf = None
+        self._transposed = None
+
+    @property
+    def state_dtype(self):
+        """The smallest unsigned integer dtype that can hold every state index."""
+        return np.min_scalar_type(max(self.state_count - 1, 0))
+
+    def flat_cdf(self):
+        """
+        Cumulative transition rows, offset by their row index and flattened:
+        entry (i, j) holds i + P[i, 0] + ... + P[i, j]. A single searchsorted over this array
+        samples the next state of many chains at once, each in its own row.
+        For a sparse chain only the stored (non-zero) entries of each row are included.
+        """
+        if self._flat_cdf is None:
+            if self.is_sparse:
+                matrix = self.transition_matrix
+                row_lengths = np.diff(matrix.indptr)
+                cdf = np.cumsum(matrix.data)
+                row_offsets = np.concatenate(([0.0], cdf))[matrix.indptr[:-1]]
+                cdf -= np.repeat(row_offsets, row_lengths)
+                cdf[matrix.indptr[1:] - 1] = 1.0
+                cdf += np.repeat(np.arange(self.state_count), row_lengths)
+                self._flat_cdf = cdf
+            else:
+                cdf = np.cumsum(self.transition_matrix, axis=1, dtype=np.float64)
+                cdf[:, -1] = 1.0  # guard against rows summing to slightly less than 1
+                cdf += np.arange(self.state_count)[:, None]
+                self._flat_cdf = cdf.ravel()
+        return self._flat_cdf
+
+    def step(self, current_states, uniforms):
+        """
+        Advance many chains by one step using inverse-CDF sampling.
+        :param current_states: Integer array of current states, one per chain.
+        :param uniforms: Uniform [0, 1) draws, one per chain.
+        :return: An intp array of next states.
+        """
+        current_states = np.asarray(current_states, dtype=np.intp)
+        flat_cdf = self.flat_cdf()
+        positions = np.searchsorted(flat_cdf, current_states + uniforms, side='right')
+        if self.is_sparse:
+            positions = np.minimum(positions, flat_cdf.size - 1, out=positions)
+            return self.transition_matrix.indices[positions].astype(np.intp)
+        next_states = positions - current_states * self.state_count
+        return np.minimum(next_states, self.state_count - 1, out=next_states)
+
     def next_state(self, current_state):
         """
         Get the next state given the current state.
         :param current_state: The current state (integer index).
         :return: The next state (integer index).
         """
-        return np.random.choice(self.state_count, p=self.transition_matrix[current_state])
-    
+        if self.is_sparse:
+            start, stop = self.transition_matrix.indptr[current_state:current_state + 2]
+            return self.rng.choice(self.transition_matrix.indices[start:stop],
+                                   p=self.transition_matrix.data[start:stop])
+        return self.rng.choice(self.state_count, p=self.transition_matrix[current_state])
+
+    def sample(self, start_states, length, n_chains=None, block_size=1024):
+        """
+        Draw independent chains of a fixed length at once.
+        :param start_states: A start state, or an array with one start state per chain.
+        :param length: The length of every chain (including the start state).
+        :param n_chains: Number of chains; defaults to len(start_states), or 1 for a scalar.
+        :param block_size: Number of steps whose uniforms are drawn as one (n_chains, block) matrix.
+        :return: An (n_chains, length) array with dtype state_dtype.
+        """
+        start_states = np.asarray(start_states)
+        if n_chains is None:
+            n_chains = start_states.size if start_states.ndim else 1
+        current = np.broadcast_to(start_states, (n_chains,)).astype(np.intp)
+        sequences = np.empty((n_chains, length), dtype=self.state_dtype)
+        if length == 0:
+            return sequences
+        sequences[:, 0] = current
+        for block_start in range(1, length, block_size):
+            block_stop = min(block_start + block_size, length)
+            uniforms = self.rng.random((n_chains, block_stop - block_start))
+            for t in range(block_start, block_stop):
+                current = self.step(current, uniforms[:, t - block_start])
+                sequences[:, t] = current
+        return sequences
+
     def generate_sequence(self, start_state, length):
         """
         Generate a sequence of states starting from a given state.
@@ -23,15 +112,312 @@ class MarkovChain:
         :param length: The length of the sequence to generate.
         :return: A list of states representing the generated sequence.
         """
-        sequence = [start_state]
-        for _ in range(length - 1):
-            next_state = self.next_state(sequence[-1])
-            sequence.append(next_state)
-        return sequence
-
-p = np.array([[0.3, 0.7], [0.2, 0.8]])
-mc = MarkovChain(p)
-start = 0  # Starting from state 0
-sequence_length = 10
-sequence = mc.generate_sequence(start, sequence_length)
-print("Generated sequence:", sequence)
+        return self.sample(start_state, length)[0].tolist()
+
+    def propagate(self, distribution):
+        """
+        One step of the distribution over states: returns distribution @ P.
+        Uses a sparse mat-vec with the cached transpose for sparse chains.
+        """
+        if self.is_sparse:
+            if self._transposed is None:
+                self._transposed = self.transition_matrix.T.tocsr()
+            return self._transposed @ distribution
+        return distribution @ self.transition_matrix
+
+    def distribution_after(self, n_steps, initial):
+        """
+        Distribution over states after n_steps.
+        :param initial: A start state (integer index) or a probability vector over states.
+        :return: A float64 probability vector.
+        """
+        if np.ndim(initial) == 0:
+            distribution = np.zeros(self.state_count)
+            distribution[initial] = 1.0
+        else:
+            distribution = np.asarray(initial, dtype=np.float64)
+        for _ in range(n_steps):
+            distribution = self.propagate(distribution)
+        return distribution
+
+    def stationary_distribution(self, method="power", tol=1e-12, max_iter=100000):
+        """
+        Stationary distribution pi with pi = pi @ P.
+        :param method: "power" iterates the lazy chain (P + I) / 2, which has the same stationary
+            distribution but also converges for periodic chains; "eigs" uses the sparse eigensolver
+            (the dense one for chains with fewer than 3 states).
+        :param tol: L1 convergence tolerance for power iteration.
+        :param max_iter: Iteration limit for power iteration.
+        :return: A float64 probability vector.
+        """
+        if method == "eigs":
+            if self.state_count < 3:
+                # ARPACK needs k < N - 1; tiny chains use the dense solver, eigenvalue closest to 1
+                matrix = self.transition_matrix.toarray() if self.is_sparse else self.transition_matrix
+                values, vectors = np.linalg.eig(matrix.T)
+                pi = np.abs(vectors[:, np.argmin(np.abs(values - 1))].real)
+                return pi / pi.sum()
+            operator = self.transition_matrix.T if self.is_sparse else sp.csr_matrix(self.transition_matrix).T
+            _, vectors = spla.eigs(operator, k=1, which="LM")
+            pi = np.abs(vectors[:, 0].real)
+            return pi / pi.sum()
+        pi = np.full(self.state_count, 1.0 / self.state_count)
+        for _ in range(max_iter):
+            next_pi = 0.5 * (pi + self.propagate(pi))
+            if np.abs(next_pi - pi).sum() < tol:
+                return next_pi
+            pi = next_pi
+        return pi
+
+    def hitting_times(self, targets):
+        """
+        Expected number of steps to first reach any of the target states, from every state.
+        Solves (I - Q) h = 1 over the non-target states, where Q is P restricted to them;
+        every state must be able to reach a target.
+        :param targets: A target state or an iterable of target states.
+        :return: A float64 vector with 0 at the targets.
+        """
+        is_target = np.zeros(self.state_count, dtype=bool)
+        is_target[np.atleast_1d(targets)] = True
+        others = np.flatnonzero(~is_target)
+        times = np.zeros(self.state_count)
+        if others.size == 0:
+            return times
+        matrix = self.transition_matrix if self.is_sparse else sp.csr_matrix(self.transition_matrix)
+        restricted = matrix[others][:, others]
+        system = sp.identity(others.size, format="csr") - restricted
+        times[others] = spla.spsolve(system.tocsc(), np.ones(others.size))
+        return times
+
+    @classmethod
+    def fit(cls, sequences, state_count, smoothing=0.0, dense=None, seed=None):
+        """
+        Estimate a chain from observed state sequences.
+        :param sequences: An iterable of integer sequences (lists, arrays or memmaps).
+        :param state_count: Number of states.
+        :return: A MarkovChain; see TransitionCounter.to_chain for smoothing and dense.
+        """
+        counter = TransitionCounter(state_count)
+        counter.update_many(sequences)
+        return counter.to_chain(smoothing=smoothing, dense=dense, seed=seed)
+
+
+class TransitionCounter:
+    DENSE_LIMIT = 1 << 24  # at most this many cells are counted in a dense bincount table
+
+    def __init__(self, state_count, chunk_size=1 << 22):
+        """
+        Streaming transition-count accumulator for fitting a MarkovChain.
+        Counts are kept in a dense bincount table for small state spaces, otherwise as sorted
+        unique (from * state_count + to) codes with their counts. Counters are picklable, so
+        worker processes can each count a shard and the results can be combined with merge().
+        :param state_count: Number of states.
+        :param chunk_size: Number of transitions processed per vectorized chunk.
+        """
+        self.state_count = state_count
+        self.chunk_size = chunk_size
+        self.is_dense = state_count * state_count <= self.DENSE_LIMIT
+        if self.is_dense:
+            self._table = np.zeros(state_count * state_count, dtype=np.int64)
+        else:
+            self._codes = np.empty(0, dtype=np.int64)
+            self._counts = np.empty(0, dtype=np.int64)
+
+    def _add_codes(self, codes, counts=None):
+        if self.is_dense:
+            self._table += np.bincount(codes, weights=counts, minlength=self._table.size).astype(np.int64)
+            return
+        if counts is None:
+            codes, counts = np.unique(codes, return_counts=True)
+        all_codes = np.concatenate((self._codes, codes))
+        all_counts = np.concatenate((self._counts, counts))
+        self._codes, inverse = np.unique(all_codes, return_inverse=True)
+        self._counts = np.zeros(self._codes.size, dtype=np.int64)
+        np.add.at(self._counts, inverse, all_counts)
+
+    def update(self, sequence, separator=None):
+        """
+        Count the transitions of one sequence, chunk by chunk.
+        :param sequence: An integer array-like; np.memmap input is read one chunk at a time.
+        :param separator: Optional marker value; transitions into or out of it are skipped,
+            so many sequences can be stored back to back in one file.
+        """
+        length = len(sequence)
+        for start in range(0, length - 1, self.chunk_size):
+            # chunks overlap by one element so the transition across the boundary is counted
+            chunk = np.asarray(sequence[start:start + self.chunk_size + 1], dtype=np.int64)
+            sources, targets = chunk[:-1], chunk[1:]
+            if separator is not None:
+                keep = (sources != separator) & (targets != separator)
+                sources, targets = sources[keep], targets[keep]
+            self._add_codes(sources * self.state_count + targets)
+
+    def update_many(self, sequences, separator=None):
+        for sequence in sequences:
+            self.update(sequence, separator)
+
+    def update_from_file(self, path, dtype=np.int32, separator=None):
+        """Count transitions from a raw binary file of states, memory-mapped rather than loaded."""
+        self.update(np.memmap(path, dtype=dtype, mode='r'), separator)
+
+    def merge(self, other):
+        """Add the counts of another counter (e.g. from a worker process) into this one."""
+        if other.state_count != self.state_count:
+            raise ValueError("cannot merge counters with different state counts")
+        if self.is_dense:
+            self._table += other._table
+        else:
+            self._add_codes(other._codes, other._counts)
+        return self
+
+    def to_sparse(self):
+        """The raw counts as an N x N CSR matrix."""
+        if self.is_dense:
+            return sp.csr_matrix(self._table.reshape(self.state_count, self.state_count))
+        rows, cols = np.divmod(self._codes, self.state_count)
+        return sp.csr_matrix((self._counts, (rows, cols)), shape=(self.state_count, self.state_count))
+
+    def to_chain(self, smoothing=0.0, dense=None, seed=None):
+        """
+        Normalize the counts into a MarkovChain.
+        :param smoothing: Additive (Laplace) pseudo-count for every cell; requires a dense result.
+        :param dense: Build a dense matrix; defaults to True only for small state spaces.
+        :param seed: Seed for the resulting chain.
+        States that were never left get a self-loop so every row is a valid distribution.
+        """
+        dense = self.is_dense if dense is None else dense
+        if dense:
+            if self.is_dense:
+                counts = self._table.reshape(self.state_count, self.state_count).astype(np.float64)
+            else:
+                counts = self.to_sparse().toarray().astype(np.float64)
+            counts += smoothing
+            empty = counts.sum(axis=1) == 0
+            counts[empty, empty] = 1.0
+            return MarkovChain(counts / counts.sum(axis=1, keepdims=True), seed=seed)
+        if smoothing:
+            raise ValueError("additive smoothing makes the matrix dense; pass dense=True")
+        counts = self.to_sparse().astype(np.float64)
+        empty = np.flatnonzero(np.diff(counts.indptr) == 0)
+        counts = counts + sp.csr_matrix((np.ones(empty.size), (empty, empty)), shape=counts.shape)
+        row_sums = np.asarray(counts.sum(axis=1)).ravel()
+        return MarkovChain(sp.diags(1.0 / row_sums) @ counts, seed=seed)
+
+
+class HigherOrderMarkovChain:
+    def __init__(self, order=2, seed=None):
+        """
+        Order-k Markov model over arbitrary hashable tokens (e.g. words for synthetic text).
+        Each k-tuple context is packed into one int64 key (base = vocabulary size); the sorted
+        array of keys is the index that maps a context to its compact integer id. Successors are
+        stored CSR-style (indptr / successor ids / cumulative probabilities) instead of nested dicts.
+        :param order: Number of preceding tokens that form the context.
+        :param seed: Seed (or np.random.Generator) for generation.
+        """
+        self.order = order
+        self.rng = np.random.default_rng(seed)
+        self.vocabulary = {}
+        self.tokens = []
+        self.context_keys = None
+
+    @property
+    def token_dtype(self):
+        return np.min_scalar_type(max(len(self.tokens) - 1, 0))
+
+    def _encode(self, sequence):
+        ids = np.empty(len(sequence), dtype=np.int64)
+        for i, token in enumerate(sequence):
+            ids[i] = self.vocabulary.setdefault(token, len(self.vocabulary))
+        return ids
+
+    def _context_keys(self, ids, base):
+        """Packed keys of every length-k window of ids."""
+        windows = np.lib.stride_tricks.sliding_window_view(ids, self.order)
+        return windows @ (base ** np.arange(self.order - 1, -1, -1, dtype=np.int64))
+
+    def fit(self, sequences):
+        """
+        Count successors of every k-token context.
+        :param sequences: An iterable of token sequences (e.g. lists of words).
+        :return: self
+        """
+        encoded = [self._encode(sequence) for sequence in sequences]
+        self.tokens = list(self.vocabulary)
+        base = len(self.tokens)
+        if base ** self.order >= np.iinfo(np.int64).max:
+            raise ValueError("vocabulary too large to pack contexts of this order into int64 keys")
+
+        pairs = [
+            np.column_stack((self._context_keys(ids[:-1], base), ids[self.order:]))
+            for ids in encoded if len(ids) > self.order
+        ]
+        if not pairs:
+            raise ValueError(f"need at least one sequence longer than order={self.order}")
+        pairs, counts = np.unique(np.concatenate(pairs), axis=0, return_counts=True)
+
+        self.context_keys, context_ids = np.unique(pairs[:, 0], return_inverse=True)
+        row_lengths = np.bincount(context_ids, minlength=self.context_keys.size)
+        self.indptr = np.concatenate(([0], np.cumsum(row_lengths)))
+        self.successors = pairs[:, 1].astype(self.token_dtype)
+        self.context_weights = np.bincount(context_ids, weights=counts)
+
+        cdf = np.cumsum(counts, dtype=np.float64)
+        row_offsets = np.concatenate(([0.0], cdf))[self.indptr[:-1]]
+        cdf -= np.repeat(row_offsets, row_lengths)
+        cdf /= np.repeat(self.context_weights, row_lengths)
+        cdf[self.indptr[1:] - 1] = 1.0
+        self._flat_cdf = cdf + np.repeat(np.arange(self.context_keys.size), row_lengths)
+        return self
+
+    def _random_contexts(self, size):
+        """Context ids drawn in proportion to how often each context was observed."""
+        return self.rng.choice(self.context_keys.size, size=size, p=self.context_weights / self.context_weights.sum())
+
+    def generate(self, n_sequences, length):
+        """
+        Generate a batch of token-id sequences at once.
+        Each sequence starts from a random observed context; when a generated context was never
+        observed (a dead end) that sequence continues from a fresh random context.
+        :return: An (n_sequences, length) array with dtype token_dtype.
+        """
+        base = len(self.tokens)
+        high = base ** (self.order - 1)
+        context_ids = self._random_contexts(n_sequences)
+        keys = self.context_keys[context_ids]
+        output = np.empty((n_sequences, max(length, self.order)), dtype=self.token_dtype)
+        for j in range(self.order):
+            output[:, j] = (keys // base ** (self.order - 1 - j)) % base
+        for t in range(self.order, length):
+            positions = np.searchsorted(self._flat_cdf, context_ids + self.rng.random(n_sequences), side='right')
+            next_tokens = self.successors[np.minimum(positions, self._flat_cdf.size - 1)]
+            output[:, t] = next_tokens
+            keys = (keys % high) * base + next_tokens
+            context_ids = np.searchsorted(self.context_keys, keys)
+            np.minimum(context_ids, self.context_keys.size - 1, out=context_ids)
+            dead_ends = np.flatnonzero(self.context_keys[context_ids] != keys)
+            if dead_ends.size:
+                context_ids[dead_ends] = self._random_contexts(dead_ends.size)
+                keys[dead_ends] = self.context_keys[context_ids[dead_ends]]
+        return output[:, :length]
+
+    def decode(self, ids):
+        """Map an array of token ids back to token lists."""
+        tokens = np.array(self.tokens, dtype=object)
+        return tokens[ids].tolist()
+
+    def generate_text(self, n_texts, length, separator=" "):
+        """Generate n_texts strings of `length` tokens joined by separator."""
+        return [separator.join(map(str, row)) for row in self.decode(self.generate(n_texts, length))]
+
+
+def main():
+    p = np.array([[0.3, 0.7], [0.2, 0.8]])
+    mc = MarkovChain(p)
+    start = 0  # Starting from state 0
+    sequence_length = 10
+    sequence = mc.generate_sequence(start, sequence_length)
+    print("Generated sequence:", sequence)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+'''
+Streaming PDF ingestion: extracts page text across a process pool and yields
+(file, page, text) records instead of one concatenated string. Uploaded files are written to a
+temporary directory once and workers open them by path, so no document bytes go through the pool.
+Worker functions live here (not in the Streamlit script) so they can be pickled.
+'''
+
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Iterable, Iterator, List, NamedTuple, Tuple
+
+from PyPDF2 import PdfReader
+
+
+class PageText(NamedTuple):
+    '''One extracted page: source file name, 0-based page number and text.'''
+    file: str
+    page: int
+    text: str
+
+
+def _local_path(pdf, directory: str, number: int) -> Tuple[str, str]:
+    '''
+    Returns (name, path) for a path or a file-like object such as st.UploadedFile; file objects are
+    copied once to `directory`, so workers receive a short path instead of the document bytes.
+    '''
+    if isinstance(pdf, (str, os.PathLike)):
+        return os.path.basename(pdf), os.fspath(pdf)
+    path = os.path.join(directory, f"{number}.pdf")
+    pdf.seek(0)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(pdf, f)
+    return getattr(pdf, 'name', 'document.pdf'), path
+
+
+@lru_cache(maxsize=2)
+def _reader(path: str, mtime_ns: int) -> PdfReader:
+    '''Each worker parses a document once and reuses it for all page ranges it gets from that file.'''
+    return PdfReader(path)
+
+
+def _open(path: str) -> PdfReader:
+    return _reader(path, os.stat(path).st_mtime_ns)
+
+
+def _page_count(path: str) -> int:
+    return len(_open(path).pages)
+
+
+def _extract_range(name: str, path: str, start: int, stop: int) -> List[PageText]:
+    '''Extracts pages [start, stop) of one PDF. Runs inside a worker process.'''
+    reader = _open(path)
+    return [PageText(name, i, reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+def iter_pdf_pages(pdf_docs: Iterable, max_workers: int | None = None,
+                   pages_per_task: int = 16, window: int = 8) -> Iterator[PageText]:
+    '''
+    Yields PageText records for every page of every PDF, in document order.
+    Pages are extracted in batches of `pages_per_task` on a process pool; at most
+    `window` batches are in flight, so memory is bounded by window * pages_per_task
+    pages instead of the whole corpus.
+    '''
+    with tempfile.TemporaryDirectory() as directory, ProcessPoolExecutor(max_workers=max_workers) as pool:
+        files = [_local_path(pdf, directory, number) for number, pdf in enumerate(pdf_docs)]
+        # page counts are read by the workers too, concurrently rather than one file after another
+        page_counts = [pool.submit(_page_count, path) for _, path in files]
+        pending = deque()
+        for (name, path), page_count in zip(files, page_counts):
+            page_count = page_count.result()
+            for start in range(0, page_count, pages_per_task):
+                stop = min(start + pages_per_task, page_count)
+                pending.append(pool.submit(_extract_range, name, path, start, stop))
+                if len(pending) >= window:
+                    yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
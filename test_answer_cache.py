@@ -0,0 +1,21 @@
+import numpy as np
+
+from answer_cache import SemanticAnswerCache
+
+
+def test_tuple_version_round_trip():
+    for max_entries in (3, 1000):
+        cache = SemanticAnswerCache(max_entries=max_entries)
+        version = (123, 16, None)
+        vector = np.array([1.0, 0.0, 0.0])
+        assert cache.lookup(vector, version) is None
+        cache.store(vector, version, "answer")
+        assert cache.lookup(vector, version) == "answer"
+        assert cache.lookup(vector, (123, 32, None)) is None
+        assert cache.hits == 1 and cache.misses == 2
+
+
+def test_dissimilar_question_misses():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store([1.0, 0.0], "v1", "answer")
+    assert cache.lookup([0.0, 1.0], "v1") is None